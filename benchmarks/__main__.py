@@ -0,0 +1,8 @@
+# Core Library modules
+import sys
+
+# Local modules
+from .run import main
+
+if __name__ == "__main__":
+    sys.exit(main())
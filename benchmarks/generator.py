@@ -0,0 +1,116 @@
+# Core Library modules
+import random
+from typing import List, NamedTuple
+
+LABELS = ("High", "Low", "None")
+
+
+class Profile(NamedTuple):
+    """Shape of the generated programs"""
+
+    # Number of functions per module
+    functions: int = 10
+    # Number of distinct variables (parameters and locals) per function
+    variables: int = 20
+    # Number of parameters per function
+    params: int = 4
+    # Number of statements per block
+    statements: int = 6
+    # Maximum nesting depth of branches and loops
+    depth: int = 3
+    # Probability of a statement being an `if` or a loop
+    branches: float = 0.15
+    loops: float = 0.1
+    # Fraction of simple statements that are assignments, the others are
+    # expression statements that do not change any variable
+    assignments: float = 0.8
+    # Maximum number of variables read by an expression
+    operands: int = 3
+    # Fraction of functions with flow annotations and fraction of their
+    # assignments that carry one
+    annotations: float = 1.0
+    annotated_locals: float = 0.05
+
+
+class Generator:
+    """Seeded generator of synthetic programs for the analysis"""
+
+    def __init__(self, seed: int, profile: Profile = Profile()) -> None:
+        self.rng = random.Random(seed)
+        self.profile = profile
+        self.variables: List[str] = []
+        self.lines: List[str] = []
+        self.annotate = False
+
+    def expr(self) -> str:
+        operands = self.rng.randint(
+            0, min(self.profile.operands, len(self.variables))
+        )
+        if not operands:
+            return str(self.rng.randint(0, 99))
+        return " + ".join(self.rng.sample(self.variables, operands))
+
+    def emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def block(self, indent: int, depth: int) -> None:
+        p = self.profile
+        for _ in range(self.rng.randint(1, p.statements)):
+            r = self.rng.random()
+            if depth < p.depth and r < p.branches:
+                self.emit(indent, "if {} > 0:".format(self.expr()))
+                self.block(indent + 1, depth + 1)
+                if self.rng.random() < 0.5:
+                    self.emit(indent, "else:")
+                    self.block(indent + 1, depth + 1)
+            elif depth < p.depth and r < p.branches + p.loops:
+                if self.rng.random() < 0.5:
+                    self.emit(indent, "while {} > 0:".format(self.expr()))
+                else:
+                    self.emit(
+                        indent,
+                        "for {} in range({}):".format(
+                            self.rng.choice(self.variables), self.expr()
+                        ),
+                    )
+                self.block(indent + 1, depth + 1)
+            elif self.rng.random() < p.assignments:
+                target = self.rng.choice(self.variables)
+                if self.annotate and self.rng.random() < p.annotated_locals:
+                    self.emit(
+                        indent,
+                        "{} = {}  # flow: {}".format(
+                            target, self.expr(), self.rng.choice(LABELS[:2])
+                        ),
+                    )
+                elif self.rng.random() < 0.1:
+                    self.emit(indent, "{} += {}".format(target, self.expr()))
+                else:
+                    self.emit(indent, "{} = {}".format(target, self.expr()))
+            else:
+                self.emit(indent, "print({})".format(self.expr()))
+
+    def function(self, name: str) -> None:
+        p = self.profile
+        self.variables = ["v{}".format(i) for i in range(p.variables)]
+        params = self.variables[: min(p.params, p.variables)]
+        self.annotate = self.rng.random() < p.annotations
+        header = "def {}({}):".format(name, ", ".join(params))
+        if self.annotate:
+            labels = [self.rng.choice(LABELS) for _ in params]
+            header += "  # flow: " + ", ".join(labels)
+        self.emit(0, header)
+        self.block(1, 0)
+        self.emit(1, "return {}".format(self.rng.choice(self.variables)))
+        self.emit(0, "")
+
+    def module(self) -> str:
+        self.lines = []
+        for i in range(self.profile.functions):
+            self.function("f{}".format(i))
+        return "\n".join(self.lines) + "\n"
+
+
+def generate_module(seed: int, profile: Profile = Profile()) -> str:
+    """Generate the source code of a module"""
+    return Generator(seed, profile).module()
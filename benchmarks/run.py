@@ -0,0 +1,334 @@
+# Core Library modules
+import argparse
+import ast
+import gc
+import hashlib
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# First party modules
+from staticinflowanalysis.collector import FlowIndex, collect_functions
+from staticinflowanalysis.hoare import analyse, analysers
+from staticinflowanalysis.lattice import BACKENDS
+
+# Local modules
+from .generator import Profile, generate_module
+
+SUITES: Dict[str, Profile] = {
+    # Many small functions, like most hand written code
+    "small": Profile(functions=20, variables=10, statements=5, depth=2),
+    # Few functions with hundreds of locals, like generated code
+    "wide": Profile(functions=4, variables=300, statements=40, depth=2),
+    # Deeply nested branches and loops
+    "deep": Profile(
+        functions=8, variables=30, statements=4, depth=6, branches=0.2, loops=0.2
+    ),
+    # Mostly unannotated code
+    "sparse": Profile(functions=100, variables=20, annotations=0.1),
+}
+
+# Relative change of the timing and memory metrics that counts as regression
+TOLERANCE = 0.2
+# Smaller absolute changes are noise whatever their relative size: of the
+# time a suite takes, of the p90 latency and of the peak memory
+MIN_SECONDS = 0.01
+MIN_LATENCY_MS = 0.05
+MIN_MEMORY_KB = 32
+# Runs of every measurement, the best one is reported
+REPEAT = 5
+# Measurements of a suite that seems to regress before it counts
+RETRIES = 2
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def run_suite(
+    profile: Profile,
+    modules: int,
+    seed: int,
+    backend: str,
+    engine: str,
+    repeat: int = REPEAT,
+) -> Dict[str, Any]:
+    """Run the analysis on `modules` generated modules and collect metrics.
+    Timings are the best of `repeat` runs of every module and function,
+    slower runs are noise of the machine rather than of the analysis."""
+    lattice = BACKENDS[backend]
+    sources = [generate_module(seed + i, profile) for i in range(modules)]
+    trees = [ast.parse(source) for source in sources]
+    lines = [source.splitlines() for source in sources]
+
+    # Like timeit, the garbage collector is left out of the timings
+    gc.collect()
+    gc.disable()
+    try:
+        # Throughput of analyse() on whole modules. The runs of a module are
+        # spread over the whole measurement, so that a slow phase of the
+        # machine only affects one of them.
+        module_seconds = [float("inf")] * len(trees)
+        for _ in range(repeat):
+            for m, (tree, code) in enumerate(zip(trees, lines)):
+                start = time.perf_counter()
+                analyse(tree, code, backend=lattice, engine=engine)
+                elapsed = time.perf_counter() - start
+                module_seconds[m] = min(module_seconds[m], elapsed)
+        seconds = sum(module_seconds)
+
+        # Latency, passes over loop bodies and errors per function, analysed
+        # like analyse() does, with the summaries of the functions called
+        factories = []
+        for tree, code in zip(trees, lines):
+            make, summaries = analysers(
+                tree, code, FlowIndex(code), backend=lattice, engine=engine
+            )
+            factories.append((make, summaries))
+        functions = [
+            (i, node)
+            for i, tree in enumerate(trees)
+            for node in collect_functions(tree)
+        ]
+        latencies = [float("inf")] * len(functions)
+        loop_passes = 0
+        errors: List[Any] = []
+        for run in range(repeat):
+            for f, (i, node) in enumerate(functions):
+                make, summaries = factories[i]
+                hoare = make(summaries)
+                start = time.perf_counter()
+                hoare.visit(node)
+                latencies[f] = min(latencies[f], time.perf_counter() - start)
+                if run == 0:
+                    loop_passes += hoare.loop_passes
+                    errors += [(i,) + error for error in sorted(hoare.errors)]
+    finally:
+        gc.enable()
+
+    # Peak memory of analyse(), measured separately as tracing is slow
+    tracemalloc.start()
+    for tree, code in zip(trees, lines):
+        analyse(tree, code, backend=lattice, engine=engine)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    total_lines = sum(len(code) for code in lines)
+    return {
+        "lines": total_lines,
+        "functions": len(latencies),
+        "seconds": round(seconds, 4),
+        "lines_per_sec": round(total_lines / seconds if seconds else 0.0, 1),
+        "latency_ms": {
+            name: round(percentile(latencies, p) * 1000, 3)
+            for name, p in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))
+        },
+        "loop_passes": loop_passes,
+        "peak_memory_kb": peak // 1024,
+        "errors": len(errors),
+        "errors_digest": hashlib.sha256(repr(errors).encode()).hexdigest()[:16],
+    }
+
+
+def checks(
+    old: Dict[str, Any], new: Dict[str, Any], tolerance: float, same_programs: bool
+) -> List[Tuple[str, Any, Any, float, bool]]:
+    """Metrics of a suite compared to its baseline: the metric, the old and
+    the new value, the relative change and whether it is a regression"""
+    old_p90, new_p90 = old["latency_ms"]["p90"], new["latency_ms"]["p90"]
+    # Metric, old and new value, direction of an improvement and whether the
+    # change is large enough in absolute terms to count
+    metrics = [
+        (
+            "lines_per_sec",
+            old["lines_per_sec"],
+            new["lines_per_sec"],
+            -1,
+            abs(new["seconds"] - old["seconds"]) >= MIN_SECONDS,
+        ),
+        (
+            "latency p90",
+            old_p90,
+            new_p90,
+            1,
+            abs(new_p90 - old_p90) >= MIN_LATENCY_MS,
+        ),
+        ("loop_passes", old["loop_passes"], new["loop_passes"], 0, True),
+        (
+            "peak_memory_kb",
+            old["peak_memory_kb"],
+            new["peak_memory_kb"],
+            1,
+            abs(new["peak_memory_kb"] - old["peak_memory_kb"]) >= MIN_MEMORY_KB,
+        ),
+    ]
+    result = []
+    for metric, before, after, direction, significant in metrics:
+        change = (after - before) / before if before else 0.0
+        if direction == 0:
+            # Deterministic metric, any increase is a regression
+            bad = same_programs and after > before
+        else:
+            bad = significant and direction * change > tolerance
+        result.append((metric, before, after, change, bad))
+    return result
+
+
+def same_programs(baseline: Dict[str, Any], results: Dict[str, Any]) -> bool:
+    """Whether the results are of the programs of the baseline"""
+    return all(
+        baseline["config"][key] == results["config"][key] for key in ("modules", "seed")
+    )
+
+
+def best(first: Dict[str, Any], second: Dict[str, Any]) -> Dict[str, Any]:
+    """Metrics of two runs of a suite with the better timings and memory of
+    both"""
+    merged = dict(first)
+    if second["seconds"] < first["seconds"]:
+        merged["seconds"] = second["seconds"]
+        merged["lines_per_sec"] = second["lines_per_sec"]
+    merged["latency_ms"] = {
+        name: min(value, second["latency_ms"][name])
+        for name, value in first["latency_ms"].items()
+    }
+    merged["peak_memory_kb"] = min(first["peak_memory_kb"], second["peak_memory_kb"])
+    return merged
+
+
+def compare(
+    baseline: Dict[str, Any], results: Dict[str, Any], tolerance: float
+) -> bool:
+    """Print the differences to a baseline. Returns whether any suite
+    regressed."""
+    regressed = False
+    same = same_programs(baseline, results)
+    for name, new in results["suites"].items():
+        old = baseline["suites"].get(name)
+        if old is None:
+            continue
+        print("{}:".format(name))
+        for metric, before, after, change, bad in checks(old, new, tolerance, same):
+            regressed |= bad
+            print(
+                "  {:<16} {:>12} -> {:>12} ({:+.1%}){}".format(
+                    metric, before, after, change, "  REGRESSION" if bad else ""
+                )
+            )
+        if same and old["errors_digest"] != new["errors_digest"]:
+            regressed = True
+            print("  errors differ: {} -> {}".format(old["errors"], new["errors"]))
+    return regressed
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Benchmark the analysis on generated programs",
+    )
+    parser.add_argument(
+        "--suite",
+        action="append",
+        choices=sorted(SUITES),
+        help="suites to run (default: all)",
+    )
+    parser.add_argument("--engine", choices=("ast", "cfg"), default="ast")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="bitset")
+    parser.add_argument(
+        "--modules", type=int, default=10, help="modules per suite (default: 10)"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=REPEAT,
+        help="runs of every timing, the best one counts (default: 5)",
+    )
+    parser.add_argument("--save", metavar="FILE", help="save results as baseline")
+    parser.add_argument(
+        "--compare", metavar="FILE", help="compare results to a saved baseline"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="relative slowdown that counts as regression (default: 0.2)",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    results: Dict[str, Any] = {
+        "config": {
+            "engine": args.engine,
+            "backend": args.backend,
+            "modules": args.modules,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+        },
+        "suites": {},
+    }
+    baseline: Optional[Dict[str, Any]] = None
+    same = False
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        same = same_programs(baseline, results)
+    for name in args.suite or sorted(SUITES):
+        metrics = run_suite(
+            SUITES[name],
+            args.modules,
+            args.seed,
+            args.backend,
+            args.engine,
+            args.repeat,
+        )
+        old = baseline["suites"].get(name) if baseline is not None else None
+        for _ in range(RETRIES):
+            if old is None or not any(
+                bad for *_, bad in checks(old, metrics, args.tolerance, same)
+            ):
+                break
+            # A slow phase of the machine can last longer than all runs of a
+            # suite, a regression has to show in another measurement as well
+            metrics = best(
+                metrics,
+                run_suite(
+                    SUITES[name],
+                    args.modules,
+                    args.seed,
+                    args.backend,
+                    args.engine,
+                    args.repeat,
+                ),
+            )
+        results["suites"][name] = metrics
+        print(
+            "{:<8} {:>8} lines {:>10} lines/s  p50 {:>8} ms  p99 {:>8} ms  "
+            "{:>6} loop passes  {:>8} KiB peak".format(
+                name,
+                metrics["lines"],
+                metrics["lines_per_sec"],
+                metrics["latency_ms"]["p50"],
+                metrics["latency_ms"]["p99"],
+                metrics["loop_passes"],
+                metrics["peak_memory_kb"],
+            )
+        )
+        sys.stdout.flush()
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+    if baseline is not None and compare(baseline, results, args.tolerance):
+        return 1
+    return 0
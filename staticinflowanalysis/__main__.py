@@ -0,0 +1,8 @@
+# Core Library modules
+import sys
+
+# Local modules
+from .cli import main
+
+if __name__ == "__main__":
+    sys.exit(main())
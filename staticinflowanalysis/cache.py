@@ -0,0 +1,313 @@
+# Core Library modules
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Local modules
+from .collector import FlowIndex, function_lines
+from .typedefs import Errors, Variables
+
+# Format of the cached results, part of every key. Increase it with every
+# change of the analysis that can change the errors of a function, or of the
+# layout of the entries, so that results of older versions are not used.
+CACHE_FORMAT = 1
+
+
+def function_key(
+    node: ast.FunctionDef,
+    flow_index: FlowIndex,
+    version: str,
+    var_set: Optional[Variables] = None,
+    summaries: str = "",
+) -> str:
+    """Content hash of a function definition.
+
+    The hash covers the structure of the function's AST (positions are left
+    out, so moving a function around keeps its key), the flow annotations
+    inside of the function relative to its first line, the version of the
+    plugin and of the cache format and the summaries of the functions it
+    calls."""
+    digest = hashlib.sha256()
+    digest.update("{}:{}".format(CACHE_FORMAT, version).encode())
+    digest.update(ast.dump(node).encode())
+    for lineno in flow_index.annotated_lines(function_lines(node)):
+        annotation = ",".join(conf.value for conf in flow_index.get(lineno))
+        digest.update("{}:{}".format(lineno - node.lineno, annotation).encode())
+    if var_set:
+        digest.update(",".join(sorted(var_set)).encode())
+    digest.update(summaries.encode())
+    return digest.hexdigest()
+
+
+class Cache:
+    """Interface of the persistent caches of analysis results per function.
+
+    Every entry holds the errors of a function relative to its position,
+    under the function's content hash (see `function_key`). Reading an entry
+    marks it as recently used; once the entries exceed `max_size` bytes the
+    least recently used ones are removed."""
+
+    def __init__(self, version: str, max_size: int = 64 * 1024 * 1024) -> None:
+        self.version: str = version
+        self.max_size: int = max_size
+        # Estimated size of the entries, determined on the first write
+        self.size: Optional[int] = None
+
+    def key(
+        self,
+        node: ast.FunctionDef,
+        flow_index: FlowIndex,
+        var_set: Optional[Variables] = None,
+        summaries: str = "",
+    ) -> str:
+        return function_key(node, flow_index, self.version, var_set, summaries)
+
+    def get(self, key: str, node: ast.FunctionDef) -> Optional[Errors]:
+        """Cached errors of the function `node` with the given key"""
+        raise NotImplementedError
+
+    def put(self, key: str, node: ast.FunctionDef, errors: Errors) -> None:
+        """Store the errors of the function `node` under the given key"""
+        raise NotImplementedError
+
+    def entries(self) -> List[Tuple[float, str, int]]:
+        """All entries as (last use, location, size)"""
+        raise NotImplementedError
+
+    def evict(self) -> None:
+        """Remove least recently used entries until the cache is down to
+        three quarters of its maximum size"""
+        raise NotImplementedError
+
+    @staticmethod
+    def encode(node: ast.FunctionDef, errors: Errors) -> str:
+        """Entry of the errors of the function `node`"""
+        return json.dumps(
+            [
+                (line - node.lineno, col - node.col_offset, msg)
+                for line, col, msg in errors
+            ]
+        )
+
+    @staticmethod
+    def decode(node: ast.FunctionDef, entry: str) -> Optional[Errors]:
+        """Errors of the function `node` in an entry, None if it is
+        corrupt"""
+        try:
+            errors = json.loads(entry)
+        except ValueError:
+            return None
+        return [
+            (node.lineno + line, node.col_offset + col, msg)
+            for line, col, msg in errors
+        ]
+
+
+class AnalysisCache(Cache):
+    """Analysis cache in a directory: every entry is a small JSON file in
+    `directory`, named after the function's content hash."""
+
+    def __init__(
+        self, directory: str, version: str, max_size: int = 64 * 1024 * 1024
+    ) -> None:
+        super().__init__(version, max_size)
+        self.directory: str = directory
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key: str, node: ast.FunctionDef) -> Optional[Errors]:
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                entry = f.read()
+            os.utime(path)
+        except OSError:
+            return None
+        return self.decode(node, entry)
+
+    def put(self, key: str, node: ast.FunctionDef, errors: Errors) -> None:
+        entry = self.encode(node, errors)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                f.write(entry)
+            os.replace(tmp, self.path(key))
+        except OSError:
+            return
+
+        if self.size is None:
+            self.size = sum(size for _, _, size in self.entries())
+        else:
+            self.size += len(entry)
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self) -> List[Tuple[float, str, int]]:
+        entries: List[Tuple[float, str, int]] = []
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".json"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, entry.path, stat.st_size))
+        except OSError:
+            pass
+        return entries
+
+    def evict(self) -> None:
+        entries = sorted(self.entries())
+        size = sum(size for _, _, size in entries)
+        for _, path, entry_size in entries:
+            if size <= self.max_size * 3 // 4:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            size -= entry_size
+        self.size = size
+
+
+class SharedCache(Cache):
+    """Analysis cache in a single SQLite database, to be shared by processes
+    analysing files at the same time (e.g. flake8's workers) and by
+    successive runs.
+
+    SQLite's file locking serializes concurrent writers, so the size of the
+    cache is exact across all processes and the least recently used entries
+    are evicted once it exceeds `max_size` bytes. Every process opens a
+    connection of its own on first use; connections are neither inherited
+    by forked processes nor pickled."""
+
+    # Seconds to wait for a lock held by another process
+    TIMEOUT = 10.0
+
+    def __init__(
+        self, database: str, version: str, max_size: int = 64 * 1024 * 1024
+    ) -> None:
+        super().__init__(version, max_size)
+        self.database: str = database
+        self._connection: Optional[sqlite3.Connection] = None
+        # Process the connection was opened in
+        self._pid: Optional[int] = None
+
+    def __getstate__(self) -> Dict[str, Any]:
+        state = self.__dict__.copy()
+        state["_connection"] = state["_pid"] = None
+        return state
+
+    def connect(self) -> Optional[sqlite3.Connection]:
+        """Connection of this process to the database, None if it cannot be
+        opened"""
+        if self._connection is not None and self._pid == os.getpid():
+            return self._connection
+        try:
+            directory = os.path.dirname(self.database)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.database, timeout=self.TIMEOUT, isolation_level=None
+            )
+            # Readers do not block the writer and vice versa, and commits
+            # are not synced to disk one by one (a crash can only lose the
+            # most recent entries)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, errors TEXT NOT NULL, "
+                "used REAL NOT NULL, size INTEGER NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS entries_used ON entries (used)"
+            )
+        except sqlite3.Error:
+            return None
+        self._connection, self._pid = connection, os.getpid()
+        return connection
+
+    def get(self, key: str, node: ast.FunctionDef) -> Optional[Errors]:
+        connection = self.connect()
+        if connection is None:
+            return None
+        try:
+            row = connection.execute(
+                "SELECT errors FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE entries SET used = ? WHERE key = ?", (time.time(), key)
+            )
+        except sqlite3.Error:
+            return None
+        return self.decode(node, row[0])
+
+    def put(self, key: str, node: ast.FunctionDef, errors: Errors) -> None:
+        connection = self.connect()
+        if connection is None:
+            return
+        entry = self.encode(node, errors)
+        try:
+            connection.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                (key, entry, time.time(), len(entry)),
+            )
+            if self.size is None:
+                self.size = self.total(connection)
+            else:
+                self.size += len(entry)
+            if self.size > self.max_size:
+                # Other processes may have evicted entries in the meantime
+                self.size = self.total(connection)
+                if self.size > self.max_size:
+                    self.evict()
+        except sqlite3.Error:
+            return
+
+    @staticmethod
+    def total(connection: sqlite3.Connection) -> int:
+        return connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def entries(self) -> List[Tuple[float, str, int]]:
+        connection = self.connect()
+        if connection is None:
+            return []
+        try:
+            return connection.execute(
+                "SELECT used, key, size FROM entries"
+            ).fetchall()
+        except sqlite3.Error:
+            return []
+
+    def evict(self) -> None:
+        connection = self.connect()
+        if connection is None:
+            return
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                size = self.total(connection)
+                for key, entry_size in connection.execute(
+                    "SELECT key, size FROM entries ORDER BY used"
+                ).fetchall():
+                    if size <= self.max_size * 3 // 4:
+                        break
+                    connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    size -= entry_size
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                connection.execute("ROLLBACK")
+                raise
+        except sqlite3.Error:
+            return
+        self.size = size
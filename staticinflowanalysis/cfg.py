@@ -0,0 +1,229 @@
+# Core Library modules
+import ast
+import heapq
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+# Local modules
+from .collector import collect_free_variables
+from .typedefs import Variables
+
+
+class Block:
+    """Basic block of a function's control flow graph.
+
+    Guard blocks carry the test of an `if`, `while` or `for` statement (`loop`
+    is set for the latter two) and no statements. `guards` holds the guard
+    blocks whose test is part of the context of this block."""
+
+    __slots__ = (
+        "id",
+        "stmts",
+        "test",
+        "test_vars",
+        "loop",
+        "guards",
+        "succs",
+        "preds",
+    )
+
+    def __init__(self, id: int, guards: Tuple[int, ...]) -> None:
+        self.id: int = id
+        self.stmts: List[ast.stmt] = []
+        self.test: Optional[ast.expr] = None
+        self.test_vars: Variables = set()
+        self.loop: bool = False
+        self.guards: Tuple[int, ...] = guards
+        self.succs: List[int] = []
+        self.preds: List[int] = []
+
+
+class CFG:
+    """Control flow graph of a single function definition.
+
+    The graph is built along the statements the Hoare visitor analyses:
+    `while` and `for` loops get a back edge to their guard block, `if`
+    statements split and join again, and the bodies of all other compound
+    statements are analysed in sequence. Nested function definitions are
+    not part of the graph, they are collected in `functions` instead.
+    `free_vars` determines the variables the tests of guards read."""
+
+    def __init__(
+        self,
+        node: ast.FunctionDef,
+        free_vars: Callable[[ast.AST], Variables] = collect_free_variables,
+    ) -> None:
+        self.free_vars: Callable[[ast.AST], Variables] = free_vars
+        self.blocks: List[Block] = []
+        self.functions: List[ast.FunctionDef] = []
+        self.scopes: Dict[int, List[int]] = {}
+        self.entry: Block = self.new_block(())
+        self.exit: Block = self.add_stmts(node.body, self.entry, ())
+        self.order: List[int] = self.reverse_postorder()
+
+    def new_block(self, guards: Tuple[int, ...]) -> Block:
+        block = Block(len(self.blocks), guards)
+        self.blocks.append(block)
+        for guard in guards:
+            self.scopes[guard].append(block.id)
+        return block
+
+    def add_edge(self, src: Block, dst: Block) -> None:
+        src.succs.append(dst.id)
+        dst.preds.append(src.id)
+
+    def new_guard(
+        self, test: ast.expr, current: Block, guards: Tuple[int, ...]
+    ) -> Block:
+        guard = self.new_block(guards)
+        guard.test = test
+        guard.test_vars = self.free_vars(test)
+        self.scopes[guard.id] = []
+        self.add_edge(current, guard)
+        return guard
+
+    def add_stmts(
+        self, stmts: List[ast.stmt], current: Block, guards: Tuple[int, ...]
+    ) -> Block:
+        """Add the given statements to the graph, starting in block
+        `current`. Returns the block control flow ends up in."""
+        for stmt in stmts:
+            current = self.add_stmt(stmt, current, guards)
+        return current
+
+    def add_stmt(
+        self, stmt: ast.stmt, current: Block, guards: Tuple[int, ...]
+    ) -> Block:
+        if isinstance(stmt, ast.FunctionDef):
+            self.functions.append(stmt)
+            return current
+        if isinstance(stmt, (ast.While, ast.For)):
+            test = stmt.test if isinstance(stmt, ast.While) else stmt.iter
+            guard = self.new_guard(test, current, guards)
+            guard.loop = True
+            inner = guards + (guard.id,)
+            start = self.new_block(inner)
+            self.add_edge(guard, start)
+            self.add_edge(self.add_stmts(stmt.body, start, inner), guard)
+            after = self.new_block(guards)
+            self.add_edge(guard, after)
+            return after
+        if isinstance(stmt, ast.If):
+            guard = self.new_guard(stmt.test, current, guards)
+            inner = guards + (guard.id,)
+            after = self.new_block(guards)
+            for branch in (stmt.body, stmt.orelse):
+                start = self.new_block(inner)
+                self.add_edge(guard, start)
+                self.add_edge(self.add_stmts(branch, start, inner), after)
+            return after
+        if has_body(stmt):
+            # Analyse the bodies of any other compound statement in sequence
+            for child in ast.iter_child_nodes(stmt):
+                if isinstance(child, ast.stmt):
+                    current = self.add_stmt(child, current, guards)
+                elif not isinstance(child, ast.expr) and has_body(child):
+                    # Exception handlers and match cases
+                    for grandchild in ast.iter_child_nodes(child):
+                        if isinstance(grandchild, ast.stmt):
+                            current = self.add_stmt(grandchild, current, guards)
+            return current
+        if current.test is not None or current.succs:
+            # Never put statements into guard blocks or finished blocks
+            nxt = self.new_block(guards)
+            self.add_edge(current, nxt)
+            current = nxt
+        current.stmts.append(stmt)
+        return current
+
+    def reverse_postorder(self) -> List[int]:
+        # Successors are explored last to first, so that the blocks of a
+        # loop body come before the blocks following the loop
+        seen: Set[int] = set()
+        order: List[int] = []
+        stack: List[Tuple[int, int]] = [(self.entry.id, 0)]
+        seen.add(self.entry.id)
+        while stack:
+            block, i = stack.pop()
+            succs = self.blocks[block].succs
+            if i < len(succs):
+                stack.append((block, i + 1))
+                succ = succs[-1 - i]
+                if succ not in seen:
+                    seen.add(succ)
+                    stack.append((succ, 0))
+            else:
+                order.append(block)
+        order.reverse()
+        return order
+
+
+def has_body(node: ast.AST) -> bool:
+    """Whether the node contains statements"""
+    return any(
+        isinstance(child, ast.stmt)
+        or (not isinstance(child, ast.expr) and has_body(child))
+        for child in ast.iter_child_nodes(node)
+    )
+
+
+def solve(cfg: CFG, hoare: Any) -> Any:
+    """Worklist fixpoint iteration over the control flow graph.
+
+    Blocks are processed in reverse postorder, a block is only processed
+    again when the output state of one of its predecessors or the
+    dependencies of one of its guards changed. The statements of a block are
+    analysed with the transfer rules of `hoare`. Returns the state at the end
+    of the function."""
+    lattice = hoare.lattice
+    rank: Dict[int, int] = {b: i for i, b in enumerate(cfg.order)}
+    outs: Dict[int, Any] = {}
+    guard_deps: Dict[int, Any] = {}
+    worklist: List[int] = list(range(len(cfg.order)))
+    queued: Set[int] = set(cfg.order)
+
+    def enqueue(block: int) -> None:
+        if block not in queued and block in rank:
+            queued.add(block)
+            heapq.heappush(worklist, rank[block])
+
+    while worklist:
+        block = cfg.blocks[cfg.order[heapq.heappop(worklist)]]
+        queued.discard(block.id)
+
+        preds = [outs[p] for p in block.preds if p in outs]
+        if block is cfg.entry:
+            state = lattice.initial()
+        elif not preds:
+            continue
+        else:
+            state = preds[0]
+            for other in preds[1:]:
+                state = lattice.join(state, other)
+
+        if block.test is not None:
+            if block.loop:
+                hoare.loop_passes += 1
+            deps = lattice.deps(state, block.test_vars)
+            old = guard_deps.get(block.id)
+            if old is None or not lattice.equal(old, deps):
+                guard_deps[block.id] = deps
+                for dependent in cfg.scopes[block.id]:
+                    enqueue(dependent)
+
+        context = lattice.empty()
+        for guard in block.guards:
+            context = context | guard_deps.get(guard, context)
+
+        if block.stmts:
+            hoare.indeps = hoare.snapshot(state)
+            hoare.context = context
+            for stmt in block.stmts:
+                hoare.visit(stmt)
+            state = hoare.indeps
+
+        if block.id not in outs or outs[block.id] != state:
+            outs[block.id] = state
+            for succ in block.succs:
+                enqueue(succ)
+
+    return outs.get(cfg.exit.id, lattice.initial())
@@ -0,0 +1,304 @@
+# Core Library modules
+import argparse
+import ast
+import fnmatch
+import json
+import multiprocessing
+import os
+import sys
+import tokenize
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# Local modules
+from .cache import AnalysisCache, SharedCache
+from .diff import changed_lines
+from .hoare import analyse
+from .lattice import BACKENDS
+from .levels import SecurityLattice
+from .plugin import Plugin
+from .server import serve
+from .stats import FunctionStats, format_stats
+from .typedefs import ErrorCode, Errors
+
+DEFAULT_EXCLUDE = ".svn,CVS,.bzr,.hg,.git,__pycache__,.tox,.nox,.eggs,*.egg"
+
+FileResult = Tuple[str, Errors]
+
+STA002: ErrorCode = "STA002 Analysis failed with {error}: {msg}".format
+
+# Analysis settings of the worker processes, see `init_worker`
+settings: Dict[str, Any] = {}
+
+
+def discover(paths: Sequence[str], exclude: Sequence[str]) -> Iterator[str]:
+    """Find all python files in the given paths"""
+
+    def excluded(path: str) -> bool:
+        name = os.path.basename(path)
+        return any(
+            fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern)
+            for pattern in exclude
+        )
+
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not excluded(os.path.join(root, d)))
+            for name in sorted(files):
+                filename = os.path.join(root, name)
+                if name.endswith(".py") and not excluded(filename):
+                    yield filename
+
+
+def init_worker(options: Dict[str, Any]) -> None:
+    settings.clear()
+    settings.update(options)
+
+
+def check_file(filename: str) -> FileResult:
+    """Parse and analyse a single file"""
+    try:
+        with tokenize.open(filename) as f:
+            # Lines only end at newlines, as in the line numbers of the tree
+            lines = f.readlines()
+        tree = ast.parse("".join(lines), filename)
+    except SyntaxError as e:
+        line, col = e.lineno or 1, (e.offset or 1) - 1
+        return filename, [(line, col, "E999 SyntaxError: {}".format(e.msg))]
+    except (OSError, UnicodeDecodeError) as e:
+        return filename, [(1, 0, "E902 {}: {}".format(type(e).__name__, e))]
+
+    stats: Optional[List[FunctionStats]] = [] if settings.get("stats") else None
+    changed = settings.get("changed")
+    try:
+        errors = analyse(
+            tree,
+            lines,
+            backend=BACKENDS[settings.get("backend", "bitset")],
+            engine=settings.get("engine", "ast"),
+            cache=settings.get("cache"),
+            stats=stats,
+            matrix_threshold=settings.get("matrix_threshold"),
+            demand=settings.get("demand", False),
+            levels=settings.get("levels"),
+            workers=settings.get("workers", 1),
+            changed=(
+                changed.get(os.path.realpath(filename), set())
+                if changed is not None
+                else None
+            ),
+        )
+    except OSError as e:
+        # Most likely the cache, the other files are still analysed
+        return filename, [(1, 0, "E902 {}: {}".format(type(e).__name__, e))]
+    except Exception as e:
+        # A bug of the analysis, or code it does not support
+        return filename, [(1, 0, STA002(error=type(e).__name__, msg=e))]
+    if stats:
+        errors += [(r.line, r.col, format_stats(r)) for r in stats]
+    return filename, sorted(errors)
+
+
+def check_files(
+    filenames: List[str], jobs: int, options: Dict[str, Any]
+) -> Iterator[FileResult]:
+    """Analyse the given files, in a pool of `jobs` processes if there is
+    more than one. Results are yielded in the order of `filenames` as soon as
+    they are available."""
+    if jobs <= 1 or len(filenames) <= 1:
+        init_worker(options)
+        for filename in filenames:
+            yield check_file(filename)
+        return
+
+    # Hand out a few chunks per process so that the work stays balanced
+    # without paying the inter-process overhead for every single file
+    chunksize = max(1, len(filenames) // (jobs * 4))
+    with multiprocessing.Pool(jobs, init_worker, (options,)) as pool:
+        yield from pool.imap(check_file, filenames, chunksize)
+
+
+def format_error(filename: str, line: int, col: int, msg: str, fmt: str) -> str:
+    if fmt == "json":
+        code, _, text = msg.partition(" ")
+        return json.dumps(
+            {
+                "filename": filename,
+                "line_number": line,
+                "column_number": col + 1,
+                "code": code,
+                "text": text,
+            }
+        )
+    return "{}:{}:{}: {}".format(filename, line, col + 1, msg)
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m staticinflowanalysis",
+        description="Static information flow analysis of python files",
+    )
+    parser.add_argument(
+        "paths", nargs="*", default=["."], help="files and directories to check"
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="number of processes to use, the functions of a single large "
+        "file are split among them (default: number of cpus)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=("default", "json"),
+        default="default",
+        help="output format: flake8 compatible lines or one JSON object per "
+        "error and line",
+    )
+    parser.add_argument(
+        "--exclude",
+        default=DEFAULT_EXCLUDE,
+        help="comma separated patterns of files and directories to skip",
+    )
+    parser.add_argument(
+        "--extend-exclude",
+        default="",
+        help="comma separated patterns to skip in addition to --exclude",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("ast", "cfg"),
+        default="ast",
+        help="analysis engine to use",
+    )
+    parser.add_argument(
+        "--backend",
+        choices=sorted(BACKENDS),
+        default="bitset",
+        help="representation of the independency sets",
+    )
+    parser.add_argument(
+        "--matrix-threshold",
+        type=int,
+        default=None,
+        metavar="N",
+        help="analyse functions with at least N variables with numpy bit "
+        "matrices (default: never)",
+    )
+    parser.add_argument(
+        "--demand",
+        action="store_true",
+        help="only track the variables the annotated variables of a function "
+        "may depend on",
+    )
+    parser.add_argument(
+        "--levels",
+        default=None,
+        help="security levels to annotate variables with instead of High and "
+        "Low, as chains like 'Public < Internal < Secret' separated by commas",
+    )
+    parser.add_argument(
+        "--compartments",
+        default="",
+        help="comma separated compartments that can be added to the security "
+        "levels, e.g. 'Secret/HR'",
+    )
+    parser.add_argument(
+        "--diff",
+        default=None,
+        metavar="REF",
+        help="only analyse the functions changed since the git revision REF "
+        "(e.g. origin/main) and the functions calling them",
+    )
+    parser.add_argument(
+        "--cache-dir", default=None, help="cache results per function in DIR"
+    )
+    parser.add_argument(
+        "--cache-db",
+        default=None,
+        metavar="FILE",
+        help="cache results per function in the SQLite database FILE, shared "
+        "by all processes (instead of --cache-dir)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=64,
+        help="maximum size of the cache in MiB (default: 64)",
+    )
+    parser.add_argument(
+        "--lsp",
+        action="store_true",
+        help="run as a language server on stdin and stdout, publishing the "
+        "errors of the open documents as diagnostics",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="report analysis statistics of every function as STA900",
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    exclude = [
+        pattern.strip()
+        for pattern in (args.exclude + "," + args.extend_exclude).split(",")
+        if pattern.strip()
+    ]
+    options: Dict[str, Any] = {
+        "backend": args.backend,
+        "engine": args.engine,
+        "stats": args.stats,
+        "matrix_threshold": args.matrix_threshold,
+        "demand": args.demand,
+        "workers": args.jobs,
+    }
+    if args.levels:
+        try:
+            options["levels"] = SecurityLattice(args.levels, args.compartments)
+        except ValueError as e:
+            print("error: {}".format(e), file=sys.stderr)
+            return 2
+    if args.cache_db:
+        options["cache"] = SharedCache(
+            args.cache_db, Plugin.version, args.cache_size * 1024 * 1024
+        )
+    elif args.cache_dir:
+        options["cache"] = AnalysisCache(
+            args.cache_dir, Plugin.version, args.cache_size * 1024 * 1024
+        )
+
+    if args.lsp:
+        return serve(
+            {
+                "backend": BACKENDS[args.backend],
+                "engine": args.engine,
+                "cache": options.get("cache"),
+                "matrix_threshold": args.matrix_threshold,
+                "demand": args.demand,
+                "levels": options.get("levels"),
+            }
+        )
+
+    found = False
+    filenames = list(discover(args.paths, exclude))
+    if args.diff:
+        try:
+            changed = changed_lines(args.diff)
+        except ValueError as e:
+            print("error: {}".format(e), file=sys.stderr)
+            return 2
+        options["changed"] = changed
+        filenames = [f for f in filenames if os.path.realpath(f) in changed]
+    for filename, errors in check_files(filenames, args.jobs, options):
+        for line, col, msg in errors:
+            print(format_error(filename, line, col, msg, args.format))
+        if errors:
+            found = True
+            sys.stdout.flush()
+    return 1 if found else 0
@@ -1,22 +1,45 @@
 # Core Library modules
 import ast
+import bisect
 import re
+import tokenize
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 # Local modules
-from .typedefs import Variables, Confidentiality, FlowConfig
+from .levels import SecurityLattice
+from .typedefs import Annotation, Variables, Confidentiality, FlowConfig
 
 flow_regex = re.compile(r".*#\ *(flow:).*$")
 
+# Pseudo variable collecting the dependencies of a function's return value
+RETURN = "<return>"
+
 
 class VariableCollector(ast.NodeVisitor):
 
     def __init__(self) -> None:
         self.vars: Variables = set()
         self.free_only: bool = False
+        self.skip_nested: bool = False
 
     def visit_Call(self, node: ast.Call) -> None:
         for arg in node.args:
             self.visit(arg)
+        if not self.free_only:
+            # Calls of functions of the module read their keyword arguments
+            # as well (see Summaries.arguments)
+            for keyword in node.keywords:
+                self.visit(keyword.value)
 
     def visit_Name(self, node: ast.Name) -> None:
         if not self.free_only or isinstance(node.ctx, ast.Load):
@@ -27,6 +50,11 @@ class VariableCollector(ast.NodeVisitor):
         for n in node.body + node.orelse:
             self.visit(n)
 
+    def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
+        # Nested functions have their own scope
+        if not self.skip_nested:
+            self.generic_visit(node)
+
     def collect(self, tree: ast.AST, free_only: bool = True) -> Variables:
         self.vars = set()
         self.free_only = free_only
@@ -34,9 +62,29 @@ class VariableCollector(ast.NodeVisitor):
         return self.vars
 
 
-def collect_free_variables(tree: ast.AST) -> Variables:
-    c = VariableCollector()
-    return c.collect(tree)
+def collect_free_variables(
+    tree: ast.AST,
+    arguments: Optional[Callable[[ast.Call], List[ast.expr]]] = None,
+) -> Variables:
+    """Free variables of a tree. Calls contribute the free variables of
+    their positional arguments, or of the arguments `arguments` selects."""
+    # Same as VariableCollector().collect(tree), but without the overhead of
+    # a visitor method call per node
+    found: Variables = set()
+    stack: List[ast.AST] = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                found.add(node.id)
+        elif isinstance(node, ast.Call):
+            stack.extend(node.args if arguments is None else arguments(node))
+        elif isinstance(node, ast.For):
+            stack.append(node.iter)
+            stack.extend(node.body + node.orelse)
+        else:
+            stack.extend(ast.iter_child_nodes(node))
+    return found
 
 
 def collect_all_variables(tree: ast.AST) -> Variables:
@@ -44,13 +92,349 @@ def collect_all_variables(tree: ast.AST) -> Variables:
     return c.collect(tree, free_only=False)
 
 
-def extract_flow_config(line: str):
+def function_parameters(node: ast.FunctionDef) -> List[ast.arg]:
+    """All parameters of a function, positional ones first"""
+    args = node.args
+    return getattr(args, "posonlyargs", []) + args.args + args.kwonlyargs + [
+        arg for arg in (args.vararg, args.kwarg) if arg
+    ]
+
+
+def collect_scope_variables(node: ast.FunctionDef) -> Variables:
+    """Collect the parameters and variables of a function, without the ones
+    that only occur in nested function definitions."""
+    c = VariableCollector()
+    c.vars = {arg.arg for arg in function_parameters(node)}
+    c.skip_nested = True
+    for n in node.body:
+        c.visit(n)
+    return c.vars
+
+
+def assigned_variables(target: ast.expr) -> List[str]:
+    """Variables an assignment to `target` changes: the names it binds and
+    the variables whose attributes or items it sets"""
+    if isinstance(target, ast.Name):
+        return [target.id]
+    if isinstance(target, (ast.Tuple, ast.List)):
+        return [var for elt in target.elts for var in assigned_variables(elt)]
+    if isinstance(target, (ast.Starred, ast.Attribute, ast.Subscript)):
+        return assigned_variables(target.value)
+    return []
+
+
+def collect_functions(tree: ast.AST) -> List[ast.FunctionDef]:
+    """Collect the outermost function definitions of a tree in source order.
+    These are the functions the analysis starts from, nested functions are
+    analysed along with them."""
+    functions: List[ast.FunctionDef] = []
+    for child in ast.iter_child_nodes(tree):
+        if isinstance(child, ast.FunctionDef):
+            functions.append(child)
+        elif not isinstance(child, ast.expr):
+            functions += collect_functions(child)
+    return functions
+
+
+class FreeVariableIndex:
+    """Free variables of the expressions the analysis of a function reads:
+    the values of assignments and return statements and the tests of
+    branches and loops, keyed by the expression node.
+
+    The index is built in a single pass over the function (without nested
+    function definitions), so that visiting a statement again, e.g. on
+    every fixpoint iteration, does not walk its expressions again. The same
+    pass records the variables every variable is assigned from, including
+    the tests of the branches and loops around the assignment, which gives
+    the backward slice of a set of variables, and the copies between
+    variables, which give the variables that are plain copies of another
+    one."""
+
+    def __init__(
+        self,
+        node: ast.FunctionDef,
+        free_vars: Callable[[ast.AST], Variables] = collect_free_variables,
+    ) -> None:
+        self.reads: Dict[ast.AST, Variables] = {}
+        # Variables the assignments of a variable read
+        self.sources: Dict[str, Set[str]] = {}
+        # Target of the assignment starting on a line
+        self.targets: Dict[int, str] = {}
+        # Number of assignments of every variable
+        self.assigned: Dict[str, int] = {}
+        # Unconditional copies `x = y` in the body of the function itself:
+        # position of the statement in the body, line, x and y
+        self.copies: List[Tuple[int, int, str, str]] = []
+        # Variables read by every statement of the body
+        self.body_reads: List[List[Variables]] = []
+        self.free_vars: Callable[[ast.AST], Variables] = free_vars
+        for position, stmt in enumerate(node.body):
+            self.body_reads.append([])
+            if (
+                isinstance(stmt, ast.Assign)
+                and isinstance(stmt.targets[0], ast.Name)
+                and isinstance(stmt.value, ast.Name)
+            ):
+                self.copies.append(
+                    (position, stmt.lineno, stmt.targets[0].id, stmt.value.id)
+                )
+            self._add((stmt,), set())
+
+    def _read(self, expr: ast.AST) -> Variables:
+        reads = self.reads[expr] = self.free_vars(expr)
+        self.body_reads[-1].append(reads)
+        return reads
+
+    def _assign(self, var: str, reads: Variables, context: Variables) -> None:
+        self.assigned[var] = self.assigned.get(var, 0) + 1
+        sources = self.sources.setdefault(var, set())
+        sources.update(reads)
+        sources.update(context)
+
+    def _add(self, stmts: Iterable[ast.AST], context: Variables) -> None:
+        for stmt in stmts:
+            if isinstance(stmt, ast.FunctionDef):
+                continue
+            if isinstance(stmt, ast.Assign):
+                reads = self._read(stmt.value)
+                if isinstance(stmt.targets[0], ast.Name):
+                    self.targets[stmt.lineno] = stmt.targets[0].id
+                for target in stmt.targets:
+                    if not isinstance(target, ast.Name):
+                        # Setting an attribute or item reads the object
+                        reads = reads | self._read(target)
+                for target in stmt.targets:
+                    for name in assigned_variables(target):
+                        self._assign(name, reads, context)
+            elif isinstance(stmt, ast.AugAssign):
+                reads = self._read(stmt.value)
+                if not isinstance(stmt.target, ast.Name):
+                    reads = reads | self._read(stmt.target)
+                for name in assigned_variables(stmt.target):
+                    self._assign(name, reads | {name}, context)
+            elif isinstance(stmt, ast.Return):
+                reads = set() if stmt.value is None else self._read(stmt.value)
+                self._assign(RETURN, reads, context)
+            elif isinstance(stmt, ast.If):
+                inner = context | self._read(stmt.test)
+                self._add(stmt.body, inner)
+                self._add(stmt.orelse, inner)
+            elif isinstance(stmt, (ast.While, ast.For)):
+                expr = stmt.test if isinstance(stmt, ast.While) else stmt.iter
+                self._add(stmt.body, context | self._read(expr))
+            else:
+                # Other compound statements, exception handlers and match
+                # cases do not add to the context
+                self._add(
+                    (
+                        child
+                        for child in ast.iter_child_nodes(stmt)
+                        if not isinstance(child, (ast.expr, ast.expr_context))
+                    ),
+                    context,
+                )
+
+    def get(self, expr: ast.AST) -> Optional[Variables]:
+        return self.reads.get(expr)
+
+    def slice(self, roots: Iterable[str]) -> Variables:
+        """Variables the values of `roots` at the end of the function may
+        depend on, including the roots themselves"""
+        found = set(roots)
+        stack = list(found)
+        while stack:
+            for source in self.sources.get(stack.pop(), ()):
+                if source not in found:
+                    found.add(source)
+                    stack.append(source)
+        return found
+
+    def restrict(self, universe: Variables) -> None:
+        """Drop all variables outside of `universe` from the index"""
+        self.reads = {expr: reads & universe for expr, reads in self.reads.items()}
+
+    def aliases(self, keep: Variables, skip: Iterable[int]) -> Dict[str, str]:
+        """Variables that hold a copy of another variable wherever they are
+        read, mapped to that variable: variables assigned exactly once, by an
+        unconditional `x = y` before they are read, where `y` is never
+        assigned or such a copy itself. Copy chains map to their first
+        variable, which is never assigned. Only copies of names are found,
+        there is no alias analysis of attributes or containers. Variables in
+        `keep` and assignments on the lines `skip` are left alone."""
+        skip = set(skip)
+        aliases: Dict[str, str] = {}
+        first_read: Optional[Dict[str, int]] = None
+        for position, lineno, target, source in self.copies:
+            source = aliases.get(source, source)
+            if (
+                target == source
+                or target in keep
+                or lineno in skip
+                or self.assigned[target] != 1
+                or source in self.assigned
+            ):
+                continue
+            if first_read is None:
+                first_read = {}
+                for i, reads in enumerate(self.body_reads):
+                    for var in set().union(*reads):
+                        first_read.setdefault(var, i)
+            if first_read.get(target, position) < position:
+                continue
+            aliases[target] = source
+        return aliases
+
+    def rename(self, aliases: Dict[str, str]) -> None:
+        """Read the copies `aliases` as the variables they copy"""
+        self.reads = {
+            expr: reads
+            if reads.isdisjoint(aliases)
+            else {aliases.get(var, var) for var in reads}
+            for expr, reads in self.reads.items()
+        }
+
+
+def function_lines(node: ast.FunctionDef) -> range:
+    """Range of (1-based) line numbers the given function spans"""
+    end = getattr(node, "end_lineno", None) or max(
+        getattr(n, "lineno", node.lineno) for n in ast.walk(node)
+    )
+    return range(node.lineno, end + 1)
+
+
+def tokenized(lines: Sequence[str]) -> Iterator[tokenize.TokenInfo]:
+    """Tokens of the given code lines (with or without line endings)"""
+    it = (line if line.endswith("\n") else line + "\n" for line in lines)
+    return tokenize.generate_tokens(lambda: next(it, ""))
+
+
+def spans_lines(lines: Sequence[str]) -> bool:
+    """Whether a string could span more than one of the lines"""
+    return any(
+        '"""' in line or "'''" in line or line.rstrip("\r\n").endswith("\\")
+        for line in lines
+    )
+
+
+def line_comments(line: str) -> List[str]:
+    """Comments of a single line of code that is not part of a string
+    spanning multiple lines"""
+    comments: List[str] = []
+    try:
+        for token in tokenized([line]):
+            if token.type == tokenize.COMMENT:
+                comments.append(token.string)
+    except (tokenize.TokenError, SyntaxError):
+        # E.g. brackets continued on the next line, the comment (if any)
+        # was seen already
+        pass
+    return comments
+
+
+def extract_flow_config(
+    line: str, levels: Optional[SecurityLattice] = None
+) -> List[Annotation]:
     match = re.match(flow_regex, line)
     if not match:
         return []
     start_flow = match.end(1)
 
+    if levels is not None:
+        return [levels.label(x.strip()) for x in line[start_flow:].split(",")]
     return [
         Confidentiality(x.strip()) for x in line[start_flow:].split(",")
     ]
 
+
+class FlowIndex:
+    """Flow annotations of a file by line number.
+
+    Annotations are only looked for in comments, using the tokens of the
+    file (e.g. flake8's `file_tokens`) or tokenizing the lines if there are
+    none. The file is indexed once, so that files and functions without any
+    annotations can be skipped cheaply. With `levels`, annotations are labels
+    of that security lattice instead of High and Low. Annotations with an
+    unknown label are kept in `invalid`, with the reason, by line number."""
+
+    def __init__(
+        self,
+        lines: Sequence[str],
+        tokens: Optional[Iterable[tokenize.TokenInfo]] = None,
+        levels: Optional[SecurityLattice] = None,
+    ) -> None:
+        self.levels: Optional[SecurityLattice] = levels
+        self.configs: Dict[int, List[Annotation]] = {}
+        self.invalid: Dict[int, str] = {}
+        candidates = [i for i, line in enumerate(lines, 1) if "flow:" in line]
+        if candidates and tokens is None and not spans_lines(lines):
+            # Every line can be tokenized on its own, which is a lot cheaper
+            # than tokenizing the whole file
+            for lineno in candidates:
+                for comment in line_comments(lines[lineno - 1]):
+                    self.add(lineno, comment)
+        elif candidates:
+            try:
+                for token in tokens if tokens is not None else tokenized(lines):
+                    if token.type == tokenize.COMMENT and "flow:" in token.string:
+                        self.add(token.start[0], token.string)
+            except (tokenize.TokenError, SyntaxError):
+                # Not valid python, fall back to looking at whole lines
+                self.configs, self.invalid = {}, {}
+                for lineno in candidates:
+                    self.add(lineno, lines[lineno - 1])
+        self.linenos: List[int] = sorted(self.configs)
+
+    def edited(
+        self, lines: Sequence[str], start: int, old_end: int, new_end: int
+    ) -> Optional["FlowIndex"]:
+        """Index of the new `lines`, for an index built without tokens of
+        the text before the lines with indices `start` to `old_end` were
+        replaced by those from `start` to `new_end`. None if the index has to
+        be built from scratch instead, because a string may span several
+        lines."""
+        if spans_lines(lines):
+            return None
+        shift = new_end - old_end
+        index = FlowIndex([], levels=self.levels)
+        index.configs = {
+            lineno + shift if lineno > old_end else lineno: config
+            for lineno, config in self.configs.items()
+            if not start < lineno <= old_end
+        }
+        index.invalid = {
+            lineno + shift if lineno > old_end else lineno: error
+            for lineno, error in self.invalid.items()
+            if not start < lineno <= old_end
+        }
+        for lineno in range(start + 1, new_end + 1):
+            if "flow:" in lines[lineno - 1]:
+                for comment in line_comments(lines[lineno - 1]):
+                    index.add(lineno, comment)
+        index.linenos = sorted(index.configs)
+        return index
+
+    def add(self, lineno: int, comment: str) -> None:
+        try:
+            flow_conf = extract_flow_config(comment, self.levels)
+        except ValueError as e:
+            self.invalid[lineno] = str(e)
+            return
+        if flow_conf:
+            self.configs[lineno] = flow_conf
+
+    def __bool__(self) -> bool:
+        return bool(self.configs)
+
+    def get(self, lineno: int) -> List[Annotation]:
+        return self.configs.get(lineno, [])
+
+    def annotated_lines(self, lines: range) -> List[int]:
+        """Annotated line numbers in the given range"""
+        start = bisect.bisect_left(self.linenos, lines.start)
+        stop = bisect.bisect_left(self.linenos, lines.stop)
+        return self.linenos[start:stop]
+
+    def annotated(self, lines: range) -> bool:
+        """Whether any line in the given range is annotated"""
+        start = bisect.bisect_left(self.linenos, lines.start)
+        return start < len(self.linenos) and self.linenos[start] < lines.stop
@@ -0,0 +1,100 @@
+# Core Library modules
+import ast
+import os
+import re
+import subprocess
+from typing import Dict, List, Optional, Set
+
+# Matches the line range of the new file in a hunk header of a unified diff
+HUNK = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,(\d+))? @@")
+
+
+def git(args: List[str], cwd: Optional[str] = None) -> str:
+    try:
+        result = subprocess.run(
+            ["git"] + args,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True,
+        )
+    except OSError as e:
+        raise ValueError("cannot run git: {}".format(e))
+    except subprocess.CalledProcessError as e:
+        raise ValueError(
+            "git {} failed: {}".format(" ".join(args), e.stderr.strip())
+        )
+    return result.stdout
+
+
+def changed_lines(base: str, cwd: Optional[str] = None) -> Dict[str, Set[int]]:
+    """Changed lines by the real path of the file: of the working tree since
+    the git revision `base` (e.g. "origin/main"), including untracked files
+    (that are not ignored) as changed entirely, or of the last revision of a
+    range `base` (e.g. "origin/main...HEAD"), which compares commits only
+    and should end at the checked out revision. Files that were deleted or
+    did not change are left out. Where lines were only removed, the line
+    before the removal counts as changed, so that the function they were
+    removed from is found."""
+    root = git(["rev-parse", "--show-toplevel"], cwd).strip()
+    output = git(
+        [
+            "-c",
+            "core.quotePath=false",
+            "diff",
+            "--unified=0",
+            "--no-color",
+            "--no-ext-diff",
+            "--no-renames",
+            base,
+            "--",
+        ],
+        cwd,
+    )
+    changed: Dict[str, Set[int]] = {}
+    lines: Optional[Set[int]] = None
+    # Added lines may look like file headers, those only occur before the
+    # first hunk of a file
+    header = False
+    for line in output.splitlines():
+        if line.startswith("diff "):
+            header, lines = True, None
+        elif header and line.startswith("+++ "):
+            path = line[4:]
+            if path == "/dev/null":
+                lines = None
+                continue
+            if path.startswith('"'):
+                # Quoted because of quotes, backslashes or control characters,
+                # which are escaped like in a python string literal
+                path = ast.literal_eval(path)
+            path = os.path.realpath(os.path.join(root, path[2:]))
+            lines = changed.setdefault(path, set())
+        elif line.startswith("@@") and lines is not None:
+            header = False
+            match = HUNK.match(line)
+            if match is None:
+                continue
+            start = int(match.group(1))
+            count = int(match.group(2)) if match.group(2) is not None else 1
+            if count == 0:
+                lines.add(max(start, 1))
+            else:
+                lines.update(range(start, start + count))
+    if ".." in base:
+        return changed
+
+    untracked = git(["ls-files", "--others", "--exclude-standard", "-z"], root)
+    for name in untracked.split("\0"):
+        if not name:
+            continue
+        path = os.path.realpath(os.path.join(root, name))
+        try:
+            with open(path, "rb") as f:
+                count = f.read().count(b"\n")
+        except OSError:
+            continue
+        # The last line may not end with a newline
+        changed[path] = set(range(1, count + 2))
+    return changed
@@ -1,50 +1,59 @@
 # Core Library modules
 import ast
-import copy
-from typing import List, Optional, Sequence
+import multiprocessing
+import tokenize
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
 
 # Local modules
+from .cache import Cache
+from .cfg import CFG, solve
 from .collector import (
-    collect_all_variables,
+    RETURN,
+    FlowIndex,
+    FreeVariableIndex,
+    assigned_variables,
     collect_free_variables,
-    extract_flow_config,
+    collect_functions,
+    collect_scope_variables,
+    function_lines,
+    function_parameters,
+)
+from .lattice import (  # noqa: F401
+    BACKENDS,
+    BitsetLattice,
+    Lattice,
+    intersect,
+    join,
+    union,
 )
+from .stats import FunctionStats, Profiler
+from .summary import Summaries, affected
+from .transfer import TransferLattice
+from .levels import SecurityLattice
 from .typedefs import (
+    Annotation,
     Confidentiality,
     ErrorCode,
     Errors,
     FlowConfig,
-    Indeps,
+    Label,
     Variables,
 )
 
 
-def intersect(sets: Sequence[Variables]) -> Variables:
-    """ Compute intersection of the given sets """
-    if not sets:
-        return set()
-    combined: Variables = sets[0].copy()
-    for s in sets:
-        combined &= s
-    return combined
-
-
-def union(sets: Sequence[Variables]) -> Variables:
-    """ Compute union of the given sets """
-    if not sets:
-        return set()
-    combined: Variables = sets[0].copy()
-    for s in sets:
-        combined |= s
-    return combined
-
-
-def join(s1: Indeps, s2: Indeps) -> Indeps:
-    """ Join two independency sets by intersection """
-    return {x: s1[x] & s2[x] for x in s1}
-
-
 class Hoare(ast.NodeVisitor):
+    STA001: ErrorCode = "STA001 Invalid flow annotation: {error}".format
     STA100: ErrorCode = (
         "STA100 Information flow from high variable '{high}' to "
         "low variable '{low}' in {inner_func}function '{func}'".format
@@ -69,16 +78,48 @@ class Hoare(ast.NodeVisitor):
         "STA301 Information flow from low variable '{low}' to "
         "local high variable '{high}' in {inner_func}function '{func}'".format
     )
+    STA400: ErrorCode = (
+        "STA400 Information flow from {source_label} variable '{source}' to "
+        "{target_label} variable '{target}' in {inner_func}function "
+        "'{func}'".format
+    )
 
-    # TODO: Make varset optional and extract it on the go on every function
-    # definition node
-    def __init__(self, lines: Sequence[str], varset: Variables) -> None:
+    def __init__(
+        self,
+        lines: Sequence[str],
+        varset: Optional[Variables] = None,
+        backend: Type[Lattice] = BitsetLattice,
+        engine: str = "ast",
+        flow_index: Optional[FlowIndex] = None,
+        profiler: Optional[Profiler] = None,
+        summaries: Optional[Summaries] = None,
+        matrix_threshold: Optional[int] = None,
+        demand: bool = False,
+    ) -> None:
+        # Lattice backend. A lattice, the independency sets and the context
+        # are created on entry of every function definition, for the
+        # variables of that function only (unless `varset` is given)
+        self.backend: Type[Lattice] = backend
+        # Functions with at least this many variables are analysed with the
+        # matrix lattice instead, if numpy is available
+        self.matrix_threshold: Optional[int] = matrix_threshold
+        self.varset: Optional[Variables] = varset
+        # Restrict the universe of every function to the variables its
+        # labelled variables may depend on (unless `varset` is given)
+        self.demand: bool = demand
+        # Either "ast" to analyse function bodies by visiting them, or "cfg"
+        # to solve them on their control flow graph
+        self.engine: str = engine
+        # Lattice the independency sets live in
+        self.lattice: Any = None
+        # Free variables of the expressions of the function being analysed
+        self.uses: Optional[FreeVariableIndex] = None
         # Context for Hoare logic
-        self.context: Variables = set()
+        self.context: Any = None
         # Independency sets for Hoare Logic
-        self.indeps: Indeps = {}
+        self.indeps: Any = None
         # Set of all variables that we want to consider for the analysis
-        self.all_vars: Variables = varset
+        self.all_vars: Variables = set()
         # Errors we found (for flake8).
         # TODO: Might have to be extracted to a different module since this is
         # not really Hoare logic related
@@ -89,30 +130,59 @@ class Hoare(ast.NodeVisitor):
         self.low: Variables = set()
         self.locals: Variables = set()
         self.level = 0
+        # Function definitions analysed so far. Nested functions inside of
+        # loops are visited on every iteration but only analysed once.
+        self.analysed: Set[ast.FunctionDef] = set()
+        # Number of passes over loop bodies and copies of the analysis state
+        # so far
+        self.loop_passes: int = 0
+        self.copies: int = 0
+        # Records statistics per function if given
+        self.profiler: Optional[Profiler] = profiler
+        # Summaries of the functions of the module, applied to calls if given
+        self.summaries: Optional[Summaries] = summaries
+        # Function being analysed and whether the dependencies of its return
+        # value are tracked instead of checking it
+        self.scope: Optional[ast.FunctionDef] = None
+        self.summarising: bool = False
+        # Groups of variables (targets, sources) of the current function such
+        # that no target may depend on any source, and the labels of its
+        # variables if a security lattice is configured
+        self.checked: List[Tuple[Variables, Variables]] = []
+        self.labelled: Dict[str, List[Label]] = {}
 
         # Parameters
         # Code lines
         self.lines: Sequence[str] = lines
+        # Flow annotations of the code lines
+        self.flow_index: FlowIndex = flow_index or FlowIndex(lines)
 
-        # Initialize independency sets
-        for var in varset:
-            self.indeps[var] = {x for x in varset if x != var}
-
-    def calc_indeps(self, free_vars_in_expr: Variables) -> Variables:
+    def calc_indeps(self, free_vars_in_expr: Variables) -> Any:
         """Calculate the set of independencies for the
         given set of variables."""
-        if not free_vars_in_expr:
-            return self.all_vars
-
-        indeps: Variables = intersect([self.indeps[x] for x in free_vars_in_expr])
-        return indeps
+        return self.lattice.indeps(self.indeps, free_vars_in_expr)
 
-    def calc_deps(self, free_vars_in_expr: Variables) -> Variables:
+    def calc_deps(self, free_vars_in_expr: Variables) -> Any:
         """Calculate the set of dependencies for the
         given set of variables."""
-        return union([self.all_vars - self.indeps[var] for var in free_vars_in_expr])
+        return self.lattice.deps(self.indeps, free_vars_in_expr)
+
+    def free_vars(self, expr: ast.AST) -> Variables:
+        """Free variables of an expression in the current function"""
+        free_vars = self.uses.get(expr) if self.uses is not None else None
+        return self.collect_free_vars(expr) if free_vars is None else free_vars
+
+    def collect_free_vars(self, expr: ast.AST) -> Variables:
+        if self.summaries is None:
+            return collect_free_variables(expr)
+        return self.summaries.free_variables(expr, self.scope)
 
-    def add_var(self, var: str, confidentiality: Confidentiality) -> None:
+    def snapshot(self, state: Any) -> Any:
+        """Copy the given state"""
+        self.copies += 1
+        return self.lattice.copy(state)
+
+    def add_var(self, var: str, confidentiality: Annotation) -> None:
         """Add a variable with a given confidentiality to the respective set
         (high/low)"""
         if confidentiality == Confidentiality.High:
@@ -145,30 +215,83 @@ class Hoare(ast.NodeVisitor):
             )
         ]
 
+    def generic_visit(self, node: ast.AST) -> None:
+        # Expressions are only analysed as part of the statements containing
+        # them, there is no need to walk them
+        for child in ast.iter_child_nodes(node):
+            if not isinstance(child, ast.expr):
+                self.visit(child)
+
     def visit_FunctionDef(self, node: ast.FunctionDef) -> None:
         """For each function detect if there is any flow from high to low or
         low to high variables."""
-        flow_conf = extract_flow_config(self.lines[node.lineno - 1])
+        if self.summarising:
+            # Nested functions are summarised on their own
+            return
+        if node in self.analysed:
+            return
+        self.analysed.add(node)
+
+        annotated = self.flow_index.annotated_lines(function_lines(node))
+        if not annotated:
+            # Neither this function nor any nested one has flow annotations
+            return
+        nested = collect_functions(node)
+        if all(any(x in function_lines(f) for f in nested) for x in annotated):
+            # Only nested functions have flow annotations, there is nothing to
+            # check in this function itself
+            self.level += 1
+            for inner in nested:
+                self.visit(inner)
+            self.level -= 1
+            return
+
+        flow_conf = self.flow_index.get(node.lineno)
         var_names: List[str] = [arg.arg for arg in node.args.args]
 
         old_high = self.high.copy()
         old_low = self.low.copy()
         old_locals = self.locals.copy()
+        old_state = (
+            self.lattice,
+            self.indeps,
+            self.context,
+            self.all_vars,
+            self.scope,
+            self.uses,
+            self.checked,
+            self.labelled,
+        )
 
         self.high = set()
         self.low = set()
         self.locals = set()
         self.level += 1
-
-        for x, y in zip(var_names, flow_conf):
-            self.add_var(x, y)
-
-        self.generic_visit(node)
-
-        for high_var in self.high:
-            for low_var in self.low:
+        if self.profiler:
+            self.profiler.enter(self)
+
+        # Every function gets its own variable universe and starts with
+        # fresh independency sets
+        self.enter(node)
+
+        if self.may_flow(self.checked):
+            for x, y in zip(var_names, flow_conf):
+                self.add_var(x, y)
+            self.analyse_body(node)
+            self.check_labels(node)
+        else:
+            # None of the checked flows is possible, only the nested
+            # functions are left to analyse
+            for inner in collect_functions(node):
+                self.visit(inner)
+
+        high, low = list(self.high), list(self.low)
+        low_to_high = self.lattice.dependencies(self.indeps, high, low)
+        high_to_low = self.lattice.dependencies(self.indeps, low, high)
+        for high_var in high:
+            for low_var in low:
                 error_type: ErrorCode
-                if low_var not in self.indeps[high_var]:
+                if (high_var, low_var) in low_to_high:
                     # Information flow from low_var to high_var
                     if low_var in self.locals:
                         error_type = self.STA201
@@ -186,7 +309,7 @@ class Hoare(ast.NodeVisitor):
                         func=node.name,
                         inner_func=self.level > 1,
                     )
-                if high_var not in self.indeps[low_var]:
+                if (low_var, high_var) in high_to_low:
                     # Information flow from high_var to low_var
                     if high_var in self.locals:
                         error_type = self.STA200
@@ -204,109 +327,584 @@ class Hoare(ast.NodeVisitor):
                         func=node.name,
                         inner_func=self.level > 1,
                     )
+        if self.profiler:
+            self.profiler.exit(self, node)
         # Restore old variables (in case of nested functions)
         self.high = old_high
         self.low = old_low
         self.locals = old_locals
+        (
+            self.lattice,
+            self.indeps,
+            self.context,
+            self.all_vars,
+            self.scope,
+            self.uses,
+            self.checked,
+            self.labelled,
+        ) = old_state
         self.level = max(0, self.level - 1)
 
-    def visit_While(self, node: ast.While) -> None:
-        """ Fixpoint iteration for Hoare logic """
-        free_vars: Variables = collect_free_variables(node.test)
-        old_ctx: Variables = self.context.copy()
-
-        while True:
-            deps: Variables = self.calc_deps(free_vars)
-            prev_indeps = copy.deepcopy(self.indeps)
-            self.context |= deps
-
-            for n in node.body:
-                self.visit(n)
-
-            self.indeps = join(self.indeps, prev_indeps)
+    def enter(self, node: ast.FunctionDef, roots: Optional[Variables] = None) -> None:
+        """Set up a fresh analysis state for the function `node`. `roots` are
+        the variables that are checked at the end, the labelled variables of
+        the function by default."""
+        self.scope = node
+        uses = self.uses = FreeVariableIndex(node, self.collect_free_vars)
+        if roots is None:
+            self.checked = self.forbidden(node, uses)
+            roots = set().union(*(t | s for t, s in self.checked))
+        if self.varset:
+            self.all_vars = self.varset | roots
+        elif self.demand:
+            self.all_vars = uses.slice(roots)
+            uses.restrict(self.all_vars)
+        else:
+            self.all_vars = collect_scope_variables(node) | roots
+        if not self.varset:
+            # Copies are analysed as the variable they copy. The variables
+            # that are checked are never merged, so the errors need no
+            # translation back.
+            aliases = uses.aliases(
+                roots, self.flow_index.annotated_lines(function_lines(node))
+            )
+            if aliases:
+                self.all_vars = self.all_vars - aliases.keys()
+                uses.rename(aliases)
+        all_vars = self.all_vars
+        backend = self.backend
+        if (
+            self.matrix_threshold is not None
+            and "matrix" in BACKENDS
+            and len(all_vars) >= self.matrix_threshold
+        ):
+            backend = BACKENDS["matrix"]
+        self.lattice = backend(self.all_vars)
+        self.indeps = self.lattice.initial()
+        self.context = self.lattice.empty()
+
+    def labels(
+        self, node: ast.FunctionDef, uses: FreeVariableIndex
+    ) -> List[Tuple[str, Annotation]]:
+        """Annotated parameters and local variables of the function `node` in
+        the order of their annotations. `uses` is the index of the function."""
+        labels = list(
+            zip((arg.arg for arg in node.args.args), self.flow_index.get(node.lineno))
+        )
+        for lineno in self.flow_index.annotated_lines(function_lines(node)):
+            target = uses.targets.get(lineno)
+            if target is not None:
+                labels.append((target, self.flow_index.get(lineno)[0]))
+        return labels
+
+    def forbidden(
+        self, node: ast.FunctionDef, uses: FreeVariableIndex
+    ) -> List[Tuple[Variables, Variables]]:
+        """Groups (targets, sources) of the labelled variables of the function
+        `node` such that no target may depend on any source: the high and the
+        low variables both ways or, with a security lattice, the variables of
+        every label and the variables of all labels that do not flow to it.
+        Sets `labelled` as well."""
+        labels = self.labels(node, uses)
+        if self.flow_index.levels is None:
+            high = {var for var, conf in labels if conf == Confidentiality.High}
+            low = {var for var, conf in labels if conf == Confidentiality.Low}
+            return [(high, low), (low, high)] if high and low else []
+
+        self.labelled = {}
+        groups: Dict[Label, Set[str]] = {}
+        for var, label in labels:
+            if isinstance(label, Label):
+                self.labelled.setdefault(var, []).append(label)
+                groups.setdefault(label, set()).add(var)
+        # Compare the (few) distinct labels instead of all pairs of variables
+        checked = []
+        for label, targets in groups.items():
+            sources = set().union(
+                *(group for other, group in groups.items() if not other.flows_to(label))
+            )
+            if sources:
+                checked.append((targets, sources))
+        return checked
+
+    def may_flow(self, checked: List[Tuple[Variables, Variables]]) -> bool:
+        """Flow insensitive over-approximation of the checked flows: whether
+        any target may depend on any of its sources, by reachability over all
+        assignments and the tests around them in the current function. Linear
+        in the size of the function per group. Without an index of the
+        function, every flow may happen."""
+        uses = self.uses
+        return uses is None or any(
+            not uses.slice(targets).isdisjoint(sources)
+            for targets, sources in checked
+        )
+
+    def check_labels(self, node: ast.FunctionDef) -> None:
+        """Report the flows the security lattice forbids, if there is one"""
+        if self.flow_index.levels is None:
+            return
+        flows: Set[Tuple[str, str]] = set()
+        for targets, sources in self.checked:
+            flows |= self.lattice.dependencies(
+                self.indeps, sorted(targets), sorted(sources)
+            )
+        for target, source in sorted(flows):
+            # Variables annotated more than once have all their labels
+            target_label, source_label = next(
+                (t, s)
+                for t in self.labelled[target]
+                for s in self.labelled[source]
+                if not s.flows_to(t)
+            )
+            self.errors.append(
+                (
+                    node.lineno,
+                    node.col_offset,
+                    self.STA400(
+                        source=source,
+                        source_label=source_label.name,
+                        target=target,
+                        target_label=target_label.name,
+                        inner_func="inner " if self.level > 1 else "",
+                        func=node.name,
+                    ),
+                )
+            )
 
-            if self.indeps == prev_indeps:
-                break
+    def analyse_body(self, node: ast.FunctionDef) -> None:
+        if self.engine == "cfg":
+            cfg = CFG(node, self.free_vars)
+            for inner in cfg.functions:
+                self.visit(inner)
+            self.indeps = solve(cfg, self)
+        else:
+            self.generic_visit(node)
+
+    def summarise(self, node: ast.FunctionDef) -> Set[str]:
+        """Analyse the function `node` for the parameters its return value
+        depends on. Calls are resolved with the current summaries."""
+        self.summarising = True
+        self.level = 1
+        self.enter(node, {RETURN})
+        self.analyse_body(node)
+        return {
+            arg.arg
+            for arg in function_parameters(node)
+            if arg.arg in self.all_vars
+            and not self.lattice.independent(self.indeps, RETURN, arg.arg)
+        }
+
+    def visit_Return(self, node: ast.Return) -> None:
+        if not self.summarising:
+            return
+        # The return value depends on everything any of the returned values
+        # or the contexts of the return statements depend on
+        free_vars: Variables = {RETURN}
+        if node.value is not None:
+            free_vars |= self.free_vars(node.value)
+        self.lattice.assign(self.indeps, RETURN, free_vars, self.context)
 
-        self.context = old_ctx
+    def visit_While(self, node: ast.While) -> None:
+        if not self.level:
+            return self.generic_visit(node)
+        self.loop(node.test, node.body)
 
     def visit_For(self, node: ast.For) -> None:
-        """ Fixpoint iteration for Hoare logic """
-        free_vars: Variables = collect_free_variables(node.iter)
-        old_ctx: Variables = self.context.copy()
-
-        while True:
-            deps: Variables = self.calc_deps(free_vars)
-            prev_indeps = copy.deepcopy(self.indeps)
-            self.context |= deps
-
-            for n in node.body:
-                self.visit(n)
-
-            self.indeps = join(self.indeps, prev_indeps)
-
-            if self.indeps == prev_indeps:
-                break
+        if not self.level:
+            return self.generic_visit(node)
+        self.loop(node.iter, node.body)
+
+    def loop(self, test: ast.expr, body: List[ast.stmt]) -> None:
+        """Hoare logic of a loop without fixpoint iteration: the body is run
+        once in a TransferLattice to compile it into a dependency relation,
+        whose closure is then applied to the state before the loop."""
+        free_vars: Variables = self.free_vars(test)
+        lattice, indeps, context = self.lattice, self.indeps, self.context
+        transfer = TransferLattice(self.all_vars, lattice)
+
+        self.loop_passes += 1
+        self.lattice = transfer
+        self.indeps = transfer.initial()
+        # The test is evaluated at the start of every iteration, the context
+        # of the loop is constant
+        self.context = transfer.constant(context) | transfer.deps(
+            self.indeps, free_vars
+        )
+        for n in body:
+            self.visit(n)
 
-        self.context = old_ctx
+        relation = self.indeps
+        self.lattice, self.context = lattice, context
+        self.indeps = transfer.close(relation, indeps)
+        if self.profiler and not isinstance(lattice, TransferLattice):
+            # Rows of the relation are no independency sets, the sets of the
+            # variables the loop assigns are observed once it is closed
+            for i in relation.rows:
+                self.profiler.observe(lattice.size(self.indeps, transfer.names[i]))
 
     def visit_Assign(self, node: ast.Assign) -> None:
-        extracted = extract_flow_config(self.lines[node.lineno - 1])
-        var_node: ast.Name = node.targets[0]
-        if extracted:
+        if not self.level:
+            # Statements outside of functions are not analysed
+            return
+        extracted = self.flow_index.get(node.lineno)
+        var_node = node.targets[0]
+        if extracted and isinstance(var_node, ast.Name):
             # If there was a flow configuration for this assignment, we assume
             # that it was an initial assignment and thus do not analyse it at
             # this point in time.
             self.add_var(var_node.id, extracted[0])
             self.locals.add(var_node.id)
             return
-        free_vars: Variables = collect_free_variables(node.value)
-        indeps: Variables = self.calc_indeps(free_vars) - self.context
-        self.indeps[var_node.id] = indeps
+        free_vars: Variables = self.free_vars(node.value)
+        for target in node.targets:
+            if not isinstance(target, ast.Name):
+                # Setting an attribute or item reads the object
+                free_vars = free_vars | self.free_vars(target)
+        for target in node.targets:
+            # Every name of a tuple target may depend on all values, and an
+            # object whose attribute or item is set on its old value as well
+            for var in assigned_variables(target):
+                self.assign(var, free_vars)
 
     def visit_AugAssign(self, node: ast.AugAssign) -> None:
-        old_ctx: Variables = self.context.copy()
-        target: ast.Name = node.target
-        self.context |= {target.id}
-        free_vars: Variables = collect_free_variables(node.value)
-        indeps: Variables = self.calc_indeps(free_vars) - self.context
-        self.indeps[target.id] = indeps
-        self.context = old_ctx
+        if not self.level:
+            return
+        for var in assigned_variables(node.target):
+            if var not in self.all_vars:
+                continue
+            old_ctx: Any = self.context
+            self.context = self.context | self.lattice.encode({var})
+            free_vars: Variables = self.free_vars(node.value)
+            if not isinstance(node.target, ast.Name):
+                free_vars = free_vars | self.free_vars(node.target)
+            self.assign(var, free_vars)
+            self.context = old_ctx
+
+    def assign(self, var: str, free_vars: Variables) -> None:
+        """Assign `var` a value depending on `free_vars` in the current
+        context"""
+        if var not in self.all_vars:
+            # Outside of the slice of the labelled variables
+            return
+        self.lattice.assign(self.indeps, var, free_vars, self.context)
+        if self.profiler and not isinstance(self.lattice, TransferLattice):
+            self.profiler.observe(self.lattice.size(self.indeps, var))
 
     def visit_If(self, node: ast.If) -> None:
-        old_ctx: Variables = self.context.copy()
+        if not self.level:
+            return self.generic_visit(node)
+        old_ctx: Any = self.context
 
-        free_vars: Variables = collect_free_variables(node.test)
+        free_vars: Variables = self.free_vars(node.test)
 
-        deps: Variables = self.calc_deps(free_vars)
-        self.context |= deps
-        intermediate_ctx: Variables = self.context.copy()
+        deps: Any = self.calc_deps(free_vars)
+        self.context = self.context | deps
+        else_indeps: Any = self.snapshot(self.indeps)
 
         for n in node.body:
             self.visit(n)
 
-        if_indeps: Indeps = copy.deepcopy(self.indeps)
+        if_indeps: Any = self.indeps
+        self.indeps = else_indeps
 
-        if hasattr(node, "orelse"):
-            self.context = intermediate_ctx
+        for n in node.orelse:
+            self.visit(n)
 
-            for n in node.body:
-                self.visit(n)
+        self.indeps = self.lattice.join(if_indeps, self.indeps)
+        self.context = old_ctx
 
-            else_indeps: Indeps = copy.deepcopy(self.indeps)
 
-            self.indeps = join(if_indeps, else_indeps)
+# Modules with fewer lines are analysed in the calling process even if
+# workers are available, starting the worker processes would take longer
+PARALLEL_MIN_LINES = 2000
 
-        self.context = old_ctx
+# Module, flow annotations and analysis settings of a worker process of the
+# parallel analysis, see `_init_worker`
+_worker: Dict[str, Any] = {}
 
 
 def analyse(
-    tree: ast.AST, lines: Sequence[str], var_set: Optional[Variables] = None
+    tree: ast.AST,
+    lines: Sequence[str],
+    var_set: Optional[Variables] = None,
+    backend: Type[Lattice] = BitsetLattice,
+    engine: str = "ast",
+    cache: Optional[Cache] = None,
+    stats: Optional[List[FunctionStats]] = None,
+    interprocedural: bool = True,
+    matrix_threshold: Optional[int] = None,
+    tokens: Optional[Iterable[tokenize.TokenInfo]] = None,
+    demand: bool = False,
+    levels: Optional[SecurityLattice] = None,
+    workers: int = 1,
+    changed: Optional[Iterable[int]] = None,
+    selected: Optional[List[ast.FunctionDef]] = None,
+    flow_index: Optional[FlowIndex] = None,
 ) -> Errors:
     """Statically analyze the given tree using Hoare logic and return any
-    errors found"""
-    if not var_set:
-        var_set = collect_all_variables(tree)
-    hoare = Hoare(lines, var_set)
-    hoare.visit(tree)
-    return hoare.errors
+    errors found. With a cache, the results of every outermost function are
+    looked up by its content hash first. If a `stats` list is given, a
+    record for every analysed function is added to it. Calls of functions
+    defined in the module are analysed with summaries of these functions
+    unless `interprocedural` is false. Functions with at least
+    `matrix_threshold` variables are analysed with the matrix lattice.
+    Flow annotations are read from `tokens` if the file was tokenized
+    already. In `demand` mode, every function is only analysed for the
+    variables its labelled variables may depend on. Annotations are labels of
+    the security lattice `levels` if given, and every flow from a label to
+    one it is not below is reported as STA400. With more than one of
+    `workers`, the outermost functions of a module of at least
+    PARALLEL_MIN_LINES lines are analysed in a pool of processes. If the
+    `changed` lines are given, only the outermost functions containing one
+    of them and the functions calling those are analysed, and added to the
+    `selected` list if there is one. A `flow_index` of the lines that was
+    built already is used instead of indexing them again. Annotations with an
+    unknown label are reported as STA001."""
+    if flow_index is None:
+        flow_index = FlowIndex(lines, tokens, levels)
+    invalid: Errors = [
+        (lineno, 0, Hoare.STA001(error=error))
+        for lineno, error in sorted(flow_index.invalid.items())
+    ]
+    edited = None if changed is None else set(changed)
+    if not flow_index:
+        # Nothing to check without flow annotations
+        return _annotation_errors(invalid, edited)
+    options: Dict[str, Any] = {
+        "var_set": var_set,
+        "backend": backend,
+        "engine": engine,
+        "cache": cache,
+        "interprocedural": interprocedural,
+        "matrix_threshold": matrix_threshold,
+        "demand": demand,
+    }
+    make, summaries = analysers(
+        tree,
+        lines,
+        flow_index,
+        var_set,
+        backend,
+        engine,
+        interprocedural,
+        matrix_threshold,
+        demand,
+    )
+    functions: Optional[Set[ast.FunctionDef]] = None
+    if edited is not None:
+        functions = affected(tree, lines, edited, summaries)
+        if selected is not None:
+            selected += functions
+    invalid = _annotation_errors(invalid, edited, functions)
+
+    if (
+        workers > 1
+        and len(lines) >= PARALLEL_MIN_LINES
+        # Processes of a pool (e.g. flake8's) cannot start processes
+        and not multiprocessing.current_process().daemon
+    ):
+        units = [
+            i
+            for i, node in enumerate(collect_functions(tree))
+            if (functions is None or node in functions)
+            and flow_index.annotated(function_lines(node))
+        ]
+        if len(units) > 1:
+            return invalid + _analyse_parallel(
+                tree, lines, flow_index, options, units, workers, stats
+            )
+
+    profiler = Profiler() if stats is not None else None
+    errors = _analyse(
+        tree,
+        lambda: make(summaries, profiler),
+        cache,
+        flow_index,
+        var_set,
+        summaries,
+        functions,
+    )
+    if stats is not None and profiler:
+        stats += sorted(profiler.records, key=lambda r: (r.line, r.col))
+    return invalid + errors
+
+
+def _annotation_errors(
+    invalid: Errors,
+    changed: Optional[Set[int]],
+    functions: Optional[Set[ast.FunctionDef]] = None,
+) -> Errors:
+    """The errors of invalid annotations to report: with `changed` lines,
+    those on one of them or in one of the `functions` analysed again"""
+    if changed is None:
+        return invalid
+    spans = [function_lines(node) for node in functions or ()]
+    return [
+        error
+        for error in invalid
+        if error[0] in changed or any(error[0] in span for span in spans)
+    ]
+
+
+def analysers(
+    tree: ast.AST,
+    lines: Sequence[str],
+    flow_index: FlowIndex,
+    var_set: Optional[Variables] = None,
+    backend: Type[Lattice] = BitsetLattice,
+    engine: str = "ast",
+    interprocedural: bool = True,
+    matrix_threshold: Optional[int] = None,
+    demand: bool = False,
+) -> Tuple[Callable[..., Hoare], Optional[Summaries]]:
+    """Factory of the Hoare instances analysing a module the way `analyse`
+    does with the same options, and the summaries of its functions. The
+    factory takes the summaries and an optional Profiler."""
+
+    def make(
+        summaries: Optional[Summaries], profiler: Optional[Profiler] = None
+    ) -> Hoare:
+        return Hoare(
+            lines,
+            var_set,
+            backend,
+            engine,
+            flow_index,
+            profiler,
+            summaries,
+            matrix_threshold,
+            demand,
+        )
+
+    summaries = Summaries(tree, make) if interprocedural else None
+    return make, summaries
+
+
+def _analyse(
+    tree: ast.AST,
+    make: Callable[[], Hoare],
+    cache: Optional[Cache],
+    flow_index: FlowIndex,
+    var_set: Optional[Variables],
+    summaries: Optional[Summaries],
+    selected: Optional[Set[ast.FunctionDef]] = None,
+) -> Errors:
+    if cache is None and selected is None:
+        hoare = make()
+        hoare.visit(tree)
+        return hoare.errors
+
+    errors: Errors = []
+    for node in collect_functions(tree):
+        if selected is not None and node not in selected:
+            continue
+        if flow_index.annotated(function_lines(node)):
+            errors += _analyse_function(
+                node, make, cache, flow_index, var_set, summaries
+            )
+    return errors
+
+
+def _analyse_function(
+    node: ast.FunctionDef,
+    make: Callable[[], Hoare],
+    cache: Optional[Cache],
+    flow_index: FlowIndex,
+    var_set: Optional[Variables],
+    summaries: Optional[Summaries],
+) -> Errors:
+    """Errors of an outermost function and the functions nested in it"""
+    if cache is None:
+        hoare = make()
+        hoare.visit(node)
+        return hoare.errors
+
+    key = cache.key(
+        node, flow_index, var_set, summaries.signature(node) if summaries else ""
+    )
+    errors = cache.get(key, node)
+    if errors is None:
+        hoare = make()
+        hoare.visit(node)
+        errors = hoare.errors
+        cache.put(key, node, errors)
+    return errors
+
+
+def _analyse_parallel(
+    tree: ast.AST,
+    lines: Sequence[str],
+    flow_index: FlowIndex,
+    options: Dict[str, Any],
+    units: List[int],
+    workers: int,
+    stats: Optional[List[FunctionStats]],
+) -> Errors:
+    """Analyse the outermost functions with the given indices in a pool of
+    `workers` processes. Every worker keeps the summaries of the functions of
+    the module across the functions it analyses. The errors are returned in
+    the order of the functions, as in a sequential run."""
+    # A few chunks per process keep the work balanced without paying the
+    # inter-process overhead for every single function
+    chunksize = max(1, len(units) // (workers * 4))
+    errors: Errors = []
+    records: List[FunctionStats] = []
+    with multiprocessing.Pool(
+        min(workers, len(units)),
+        _init_worker,
+        (tree, lines, flow_index, options, stats is not None),
+    ) as pool:
+        for func_errors, func_records in pool.imap(
+            _analyse_unit, units, chunksize
+        ):
+            errors += func_errors
+            records += func_records
+    if stats is not None:
+        stats += sorted(records, key=lambda r: (r.line, r.col))
+    return errors
+
+
+def _init_worker(
+    tree: ast.AST,
+    lines: Sequence[str],
+    flow_index: FlowIndex,
+    options: Dict[str, Any],
+    profile: bool,
+) -> None:
+    make, summaries = analysers(
+        tree,
+        lines,
+        flow_index,
+        options["var_set"],
+        options["backend"],
+        options["engine"],
+        options["interprocedural"],
+        options["matrix_threshold"],
+        options["demand"],
+    )
+    _worker.clear()
+    _worker.update(
+        functions=collect_functions(tree),
+        make=make,
+        summaries=summaries,
+        flow_index=flow_index,
+        options=options,
+        profile=profile,
+    )
+
+
+def _analyse_unit(index: int) -> Tuple[Errors, List[FunctionStats]]:
+    """Errors and statistics of the outermost function with the given index,
+    in a worker process"""
+    options = _worker["options"]
+    summaries = _worker["summaries"]
+    profiler = Profiler() if _worker["profile"] else None
+    errors = _analyse_function(
+        _worker["functions"][index],
+        lambda: _worker["make"](summaries, profiler),
+        options["cache"],
+        _worker["flow_index"],
+        options["var_set"],
+        summaries,
+    )
+    return errors, profiler.records if profiler else []
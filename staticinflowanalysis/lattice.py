@@ -0,0 +1,486 @@
+# Core Library modules
+import operator
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Hashable,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+# Third party modules
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None  # type: ignore[assignment]
+
+# Local modules
+from .typedefs import Bitset, Indeps, Variables
+
+
+def intersect(sets: Sequence[Variables]) -> Variables:
+    """ Compute intersection of the given sets """
+    if not sets:
+        return set()
+    combined: Variables = sets[0].copy()
+    for s in sets:
+        combined &= s
+    return combined
+
+
+def union(sets: Sequence[Variables]) -> Variables:
+    """ Compute union of the given sets """
+    if not sets:
+        return set()
+    combined: Variables = sets[0].copy()
+    for s in sets:
+        combined |= s
+    return combined
+
+
+def join(s1: Indeps, s2: Indeps) -> Indeps:
+    """ Join two independency sets by intersection """
+    return {x: s1[x] & s2[x] for x in s1}
+
+
+class State:
+    """Copy-on-write mapping from variables to independency sets.
+
+    A state consists of a base container (a list or a dict) that is never
+    modified once it is shared, and a small overlay of the entries written
+    since. Taking a snapshot is O(1): both states share base and overlay and
+    the overlay is only copied on the next write. Once the overlay grows
+    larger than half of the base it is folded into a new base."""
+
+    __slots__ = ("_base", "_delta", "_shared")
+
+    def __init__(self, base: Any, delta: Optional[Dict[Hashable, Any]] = None):
+        self._base: Any = base
+        self._delta: Dict[Hashable, Any] = delta or {}
+        self._shared: bool = False
+
+    def __getitem__(self, key: Hashable) -> Any:
+        delta = self._delta
+        return delta[key] if key in delta else self._base[key]
+
+    def __setitem__(self, key: Hashable, value: Any) -> None:
+        if self._shared:
+            self._delta = dict(self._delta)
+            self._shared = False
+        self._delta[key] = value
+        if 2 * len(self._delta) > len(self._base):
+            self._base = self._materialize()
+            self._delta = {}
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, State):
+            return NotImplemented
+        if self._base is other._base:
+            return all(self[k] == other[k] for k in self._changed_keys(other))
+        return self._materialize() == other._materialize()
+
+    __hash__ = None  # type: ignore
+
+    def _changed_keys(self, other: "State") -> Iterable[Hashable]:
+        return self._delta.keys() | other._delta.keys()
+
+    def _materialize(self) -> Any:
+        if not self._delta:
+            return self._base
+        data = self._base.copy()
+        for key, value in self._delta.items():
+            data[key] = value
+        return data
+
+    def keys(self) -> Iterable[Hashable]:
+        base = self._base
+        return base.keys() if isinstance(base, dict) else range(len(base))
+
+    def snapshot(self) -> "State":
+        """O(1) copy of this state"""
+        self._shared = True
+        copy = State(self._base, self._delta)
+        copy._shared = True
+        return copy
+
+    def merge(self, other: "State", op: Callable[[Any, Any], Any]) -> "State":
+        """Combine two states entrywise using `op`. States that share their
+        base are only combined on the entries that were written."""
+        if self._base is other._base:
+            return State(
+                self._base,
+                {k: op(self[k], other[k]) for k in self._changed_keys(other)},
+            )
+        data = self._base.copy()
+        for key in self.keys():
+            data[key] = op(self[key], other[key])
+        return State(data)
+
+
+class Lattice:
+    """Interface of the independency lattice used by the Hoare logic.
+
+    A lattice is created for a fixed universe of variables and knows how to
+    build, copy, join and update states (one independency set per variable).
+    Elements (independency sets and contexts) are treated as immutable values
+    and can be combined with `|`."""
+
+    def __init__(self, universe: Variables) -> None:
+        self.all_vars: Variables = set(universe)
+
+    def initial(self) -> Any:
+        """Initial state: every variable only depends on itself"""
+        raise NotImplementedError
+
+    def empty(self) -> Any:
+        """The empty context"""
+        raise NotImplementedError
+
+    def encode(self, names: Variables) -> Any:
+        """Encode a set of variable names as a context element"""
+        raise NotImplementedError
+
+    def copy(self, state: Any) -> Any:
+        """Snapshot a state so that later updates do not affect it"""
+        raise NotImplementedError
+
+    def indeps(self, state: Any, free_vars: Variables) -> Any:
+        """Independencies of an expression with the given free variables"""
+        raise NotImplementedError
+
+    def deps(self, state: Any, free_vars: Variables) -> Any:
+        """Dependencies of an expression with the given free variables"""
+        raise NotImplementedError
+
+    def assign(
+        self, state: Any, var: str, free_vars: Variables, context: Any
+    ) -> None:
+        """Update `state` for the assignment of an expression with the given
+        free variables to `var` in the given context"""
+        raise NotImplementedError
+
+    def join(self, s1: Any, s2: Any) -> Any:
+        """ Join two states """
+        raise NotImplementedError
+
+    def independent(self, state: Any, var: str, other: str) -> bool:
+        """Whether `var` is independent of the initial value of `other`"""
+        raise NotImplementedError
+
+    def size(self, state: Any, var: str) -> int:
+        """Number of variables `var` is independent of"""
+        raise NotImplementedError
+
+    def dependencies(
+        self, state: Any, variables: Sequence[str], others: Sequence[str]
+    ) -> Set[Tuple[str, str]]:
+        """All pairs of a variable of `variables` and a variable of `others`
+        such that the former depends on the initial value of the latter"""
+        return {
+            (var, other)
+            for var in variables
+            for other in others
+            if not self.independent(state, var, other)
+        }
+
+    def equal(self, e1: Any, e2: Any) -> bool:
+        """Whether two elements (not states) are equal"""
+        return bool(e1 == e2)
+
+
+class SetLattice(Lattice):
+    """Independency sets stored as sets of variable names.
+
+    This is the original representation of the analysis and is kept around
+    for comparison with the other lattices."""
+
+    def initial(self) -> State:
+        return State(
+            {var: {x for x in self.all_vars if x != var} for var in self.all_vars}
+        )
+
+    def empty(self) -> Variables:
+        return set()
+
+    def encode(self, names: Variables) -> Variables:
+        return set(names)
+
+    def copy(self, state: State) -> State:
+        return state.snapshot()
+
+    def indeps(self, state: State, free_vars: Variables) -> Variables:
+        if not free_vars:
+            return self.all_vars
+        return intersect([state[x] for x in free_vars])
+
+    def deps(self, state: State, free_vars: Variables) -> Variables:
+        return union([self.all_vars - state[var] for var in free_vars])
+
+    def assign(
+        self, state: State, var: str, free_vars: Variables, context: Variables
+    ) -> None:
+        state[var] = self.indeps(state, free_vars) - context
+
+    def join(self, s1: State, s2: State) -> State:
+        return s1.merge(s2, operator.and_)
+
+    def independent(self, state: State, var: str, other: str) -> bool:
+        return other in state[var]
+
+    def size(self, state: State, var: str) -> int:
+        return len(state[var])
+
+
+class BitsetLattice(Lattice):
+    """Independency sets stored as integer bitmasks.
+
+    Every variable of the universe is interned as a bit position, a state maps
+    that position to a mask. Intersections, unions, joins and the comparison
+    of states are plain integer operations."""
+
+    def __init__(self, universe: Variables) -> None:
+        super().__init__(universe)
+        self.names: List[str] = sorted(self.all_vars)
+        self.index: Dict[str, int] = {x: i for i, x in enumerate(self.names)}
+        self.full: Bitset = (1 << len(self.names)) - 1
+
+    def initial(self) -> State:
+        return State([self.full ^ (1 << i) for i in range(len(self.names))])
+
+    def empty(self) -> Bitset:
+        return 0
+
+    def encode(self, names: Iterable[str]) -> Bitset:
+        mask = 0
+        for x in names:
+            mask |= 1 << self.index[x]
+        return mask
+
+    def decode(self, mask: Bitset) -> Variables:
+        """Decode a mask back into a set of variable names"""
+        return {x for i, x in enumerate(self.names) if mask >> i & 1}
+
+    def copy(self, state: State) -> State:
+        return state.snapshot()
+
+    def indeps(self, state: State, free_vars: Variables) -> Bitset:
+        mask = self.full
+        for x in free_vars:
+            mask &= state[self.index[x]]
+        return mask
+
+    def deps(self, state: State, free_vars: Variables) -> Bitset:
+        return self.indeps(state, free_vars) ^ self.full if free_vars else 0
+
+    def assign(
+        self,
+        state: State,
+        var: str,
+        free_vars: Variables,
+        context: Bitset,
+    ) -> None:
+        state[self.index[var]] = self.indeps(state, free_vars) & ~context
+
+    def join(self, s1: State, s2: State) -> State:
+        return s1.merge(s2, operator.and_)
+
+    def independent(self, state: State, var: str, other: str) -> bool:
+        return bool(state[self.index[var]] >> self.index[other] & 1)
+
+    def dependencies(
+        self, state: State, variables: Sequence[str], others: Sequence[str]
+    ) -> Set[Tuple[str, str]]:
+        # Check a variable against all others with a single mask
+        mask = self.encode(others)
+        found: Set[Tuple[str, str]] = set()
+        for var in variables:
+            deps = ~state[self.index[var]] & mask
+            while deps:
+                low = deps & -deps
+                found.add((var, self.names[low.bit_length() - 1]))
+                deps ^= low
+        return found
+
+    def size(self, state: State, var: str) -> int:
+        return bin(state[self.index[var]]).count("1")
+
+
+class DependencyLattice(Lattice):
+    """Dependency sets stored as frozensets of variable names.
+
+    Instead of the (nearly universal) independency set, every variable maps
+    to the small set of variables it depends on, so the size of a state grows
+    with the actual data flow rather than with the square of the number of
+    variables. Contexts are dependency sets as well. Sets are never modified,
+    states share them freely."""
+
+    def initial(self) -> State:
+        return State({var: frozenset((var,)) for var in self.all_vars})
+
+    def empty(self) -> FrozenSet[str]:
+        return frozenset()
+
+    def encode(self, names: Variables) -> FrozenSet[str]:
+        return frozenset(names)
+
+    def copy(self, state: State) -> State:
+        return state.snapshot()
+
+    def indeps(self, state: State, free_vars: Variables) -> Variables:
+        return self.all_vars - self.deps(state, free_vars)
+
+    def deps(self, state: State, free_vars: Variables) -> FrozenSet[str]:
+        return frozenset().union(*[state[x] for x in free_vars])
+
+    def assign(
+        self,
+        state: State,
+        var: str,
+        free_vars: Variables,
+        context: FrozenSet[str],
+    ) -> None:
+        state[var] = self.deps(state, free_vars) | context
+
+    def join(self, s1: State, s2: State) -> State:
+        return s1.merge(s2, operator.or_)
+
+    def independent(self, state: State, var: str, other: str) -> bool:
+        return other not in state[var]
+
+    def size(self, state: State, var: str) -> int:
+        return len(self.all_vars) - len(state[var])
+
+
+class Matrix:
+    """Copy-on-write wrapper of the matrix of a MatrixLattice state, so that
+    snapshots are O(1) and states compare by value"""
+
+    __slots__ = ("rows", "_shared")
+
+    def __init__(self, rows: Any) -> None:
+        self.rows: Any = rows
+        self._shared: bool = False
+
+    def __getitem__(self, i: int) -> Any:
+        return self.rows[i]
+
+    def __setitem__(self, i: int, row: Any) -> None:
+        if self._shared:
+            self.rows = self.rows.copy()
+            self._shared = False
+        self.rows[i] = row
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, Matrix):
+            return NotImplemented
+        return self.rows is other.rows or bool(np.array_equal(self.rows, other.rows))
+
+    __hash__ = None  # type: ignore
+
+    def snapshot(self) -> "Matrix":
+        self._shared = True
+        copy = Matrix(self.rows)
+        copy._shared = True
+        return copy
+
+
+class MatrixLattice(Lattice):
+    """Independency relation stored as a dense bit matrix (requires numpy).
+
+    Row i of the matrix is the independency set of variable i, packed into
+    little endian 64 bit words; contexts are single rows. Intersections over
+    the free variables of an expression, joins and comparisons of states are
+    vectorized over whole rows or the whole matrix, which pays off for
+    functions with thousands of variables."""
+
+    def __init__(self, universe: Variables) -> None:
+        super().__init__(universe)
+        self.names: List[str] = sorted(self.all_vars)
+        self.index: Dict[str, int] = {x: i for i, x in enumerate(self.names)}
+        n = len(self.names)
+        self.words: int = max(1, (n + 63) // 64)
+        self.full: Any = self._pack(np.ones(n, dtype=bool))
+
+    def _pack(self, bits: Any) -> Any:
+        """Pack boolean rows into rows of words"""
+        packed = np.packbits(bits, axis=-1, bitorder="little")
+        shape = packed.shape[:-1] + (self.words * 8,)
+        words = np.zeros(shape, dtype=np.uint8)
+        words[..., : packed.shape[-1]] = packed
+        return words.view("<u8")
+
+    def _unpack(self, words: Any) -> Any:
+        """Unpack rows of words into boolean rows"""
+        bits = np.unpackbits(words.view(np.uint8), axis=-1, bitorder="little")
+        return bits[..., : len(self.names)].astype(bool)
+
+    def initial(self) -> Matrix:
+        n = len(self.names)
+        return Matrix(self._pack(~np.eye(n, dtype=bool)))
+
+    def empty(self) -> Any:
+        return np.zeros(self.words, dtype="<u8")
+
+    def encode(self, names: Variables) -> Any:
+        bits: Any = np.zeros(len(self.names), dtype=bool)
+        bits[[self.index[x] for x in names]] = True
+        return self._pack(bits)
+
+    def copy(self, state: Matrix) -> Matrix:
+        return state.snapshot()
+
+    def indeps(self, state: Matrix, free_vars: Variables) -> Any:
+        if not free_vars:
+            return self.full
+        rows = state.rows[[self.index[x] for x in free_vars]]
+        return np.bitwise_and.reduce(rows, axis=0)
+
+    def deps(self, state: Matrix, free_vars: Variables) -> Any:
+        if not free_vars:
+            return self.empty()
+        return self.indeps(state, free_vars) ^ self.full
+
+    def assign(
+        self, state: Matrix, var: str, free_vars: Variables, context: Any
+    ) -> None:
+        state[self.index[var]] = self.indeps(state, free_vars) & ~context
+
+    def join(self, s1: Matrix, s2: Matrix) -> Matrix:
+        if s1.rows is s2.rows:
+            return s1.snapshot()
+        return Matrix(s1.rows & s2.rows)
+
+    def independent(self, state: Matrix, var: str, other: str) -> bool:
+        j = self.index[other]
+        return bool(state.rows[self.index[var], j >> 6] >> np.uint64(j & 63) & 1)
+
+    def size(self, state: Matrix, var: str) -> int:
+        return int(self._unpack(state.rows[self.index[var]]).sum())
+
+    def dependencies(
+        self, state: Matrix, variables: Sequence[str], others: Sequence[str]
+    ) -> Set[Tuple[str, str]]:
+        if not variables or not others:
+            return set()
+        rows = self._unpack(state.rows[[self.index[x] for x in variables]])
+        cols = [self.index[x] for x in others]
+        found = np.nonzero(~rows[:, cols])
+        return {(variables[i], others[j]) for i, j in zip(*found)}
+
+    def equal(self, e1: Any, e2: Any) -> bool:
+        return bool(np.array_equal(e1, e2))
+
+
+BACKENDS = {
+    "sets": SetLattice,
+    "bitset": BitsetLattice,
+    "deps": DependencyLattice,
+}
+if np is not None:
+    BACKENDS["matrix"] = MatrixLattice
@@ -0,0 +1,72 @@
+# Core Library modules
+from typing import Dict, List, Set
+
+# Local modules
+from .typedefs import Annotation, Confidentiality, Label
+
+
+class SecurityLattice:
+    """Finite order of security labels declared in the configuration.
+
+    `levels` are chains of levels separated by commas, e.g.
+    "Public < Internal < Secret < TopSecret" or, for a partial order,
+    "Public < Internal < Secret, Internal < Personnel". `compartments` is a
+    comma separated list of compartment names. A label is a level followed
+    by any of the compartments, e.g. "Secret/HR/Finance", and (l1, C1) is
+    below (l2, C2) iff l1 <= l2 and C1 is a subset of C2."""
+
+    def __init__(self, levels: str, compartments: str = "") -> None:
+        self.levels: List[str] = []
+        below: Dict[str, Set[str]] = {}
+        for chain in levels.split(","):
+            names = [name.strip() for name in chain.split("<")]
+            if not all(names):
+                raise ValueError("invalid security levels: {!r}".format(levels))
+            for name in names:
+                if name not in below:
+                    below[name] = set()
+                    self.levels.append(name)
+            for lower, upper in zip(names, names[1:]):
+                below[upper].add(lower)
+        self.compartments: List[str] = [
+            name.strip() for name in compartments.split(",") if name.strip()
+        ]
+
+        # Bits of the levels below or equal to every level
+        self.masks: Dict[str, int] = {}
+        for name in self.levels:
+            self._mask(name, below, set())
+        offset = len(self.levels)
+        for i, name in enumerate(self.compartments):
+            if name in self.masks:
+                raise ValueError("compartment {!r} is also a level".format(name))
+            self.masks[name] = 1 << offset + i
+
+    def _mask(self, name: str, below: Dict[str, Set[str]], path: Set[str]) -> int:
+        if name in self.masks:
+            return self.masks[name]
+        if name in path:
+            raise ValueError("security levels are cyclic at {!r}".format(name))
+        path.add(name)
+        mask = 1 << self.levels.index(name)
+        for lower in below[name]:
+            mask |= self._mask(lower, below, path)
+        path.discard(name)
+        self.masks[name] = mask
+        return mask
+
+    def label(self, text: str) -> Annotation:
+        """Parse the label of a flow annotation. "None" marks an unlabelled
+        variable, unknown labels raise a ValueError."""
+        if text == Confidentiality.NA.value:
+            return Confidentiality.NA
+        level, *compartments = [part.strip() for part in text.split("/")]
+        if level not in self.levels:
+            raise ValueError("unknown security level {!r}".format(level))
+        mask = self.masks[level]
+        for name in compartments:
+            if name not in self.compartments:
+                raise ValueError("unknown compartment {!r}".format(name))
+            mask |= self.masks[name]
+        names = [name for name in self.compartments if mask & self.masks[name]]
+        return Label("/".join([level] + names), mask)
@@ -1,9 +1,27 @@
 # Core Library modules
 import ast
-from typing import Any, Generator, Tuple, Type, Sequence
+import os
+import sys
+import tokenize
+from typing import (
+    Any,
+    Dict,
+    Generator,
+    List,
+    NoReturn,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+)
 
 # First party modules
+from staticinflowanalysis.cache import AnalysisCache, Cache, SharedCache
+from staticinflowanalysis.diff import changed_lines
 from staticinflowanalysis.hoare import analyse
+from staticinflowanalysis.levels import SecurityLattice
+from staticinflowanalysis.stats import FunctionStats, format_stats
 
 
 class Plugin:
@@ -11,12 +29,166 @@ class Plugin:
     name = 'staticinflowanalysis'
     version = '0.1.0'
 
-    def __init__(self, tree: ast.AST, lines: Sequence[str]):
+    cache: Optional[Cache] = None
+    stats: bool = False
+    matrix_threshold: Optional[int] = None
+    demand: bool = False
+    levels: Optional[SecurityLattice] = None
+    jobs: int = 1
+    # Changed lines by file if only changed functions are analysed
+    changed: Optional[Dict[str, Set[int]]] = None
+
+    def __init__(
+        self,
+        tree: ast.AST,
+        lines: Sequence[str],
+        file_tokens: Optional[List[tokenize.TokenInfo]] = None,
+        filename: str = "-",
+    ):
         self._tree = tree
         self._lines = lines
+        self._filename = filename
+        # Reuse flake8's tokens to find the flow annotations
+        self._tokens = file_tokens
+
+    @classmethod
+    def add_options(cls, parser: Any) -> None:
+        parser.add_option(
+            "--sta-cache-dir",
+            default=None,
+            parse_from_config=True,
+            help="Directory to cache analysis results per function in "
+            "(default: no caching)",
+        )
+        parser.add_option(
+            "--sta-cache-db",
+            default=None,
+            parse_from_config=True,
+            help="SQLite database to cache analysis results per function in, "
+            "shared by all of flake8's processes (instead of --sta-cache-dir)",
+        )
+        parser.add_option(
+            "--sta-cache-size",
+            type=int,
+            default=64,
+            parse_from_config=True,
+            help="Maximum size of the analysis cache in MiB (default: 64)",
+        )
+        parser.add_option(
+            "--sta-stats",
+            action="store_true",
+            default=False,
+            parse_from_config=True,
+            help="Report wall time, loop passes, state copies and "
+            "sizes of the analysis of every function as STA900",
+        )
+        parser.add_option(
+            "--sta-matrix-threshold",
+            type=int,
+            default=None,
+            parse_from_config=True,
+            help="Analyse functions with at least this many variables with "
+            "numpy bit matrices (default: never)",
+        )
+        parser.add_option(
+            "--sta-demand",
+            action="store_true",
+            default=False,
+            parse_from_config=True,
+            help="Only track the variables the annotated variables of a "
+            "function may depend on",
+        )
+        parser.add_option(
+            "--sta-levels",
+            default=None,
+            parse_from_config=True,
+            help="Security levels to annotate variables with instead of High "
+            "and Low, as chains like 'Public < Internal < Secret' separated by "
+            "commas. Flows from a level to one that is not above it are "
+            "reported as STA400.",
+        )
+        parser.add_option(
+            "--sta-compartments",
+            default="",
+            parse_from_config=True,
+            help="Comma separated compartments that can be added to the "
+            "security levels, e.g. 'Secret/HR'",
+        )
+        parser.add_option(
+            "--sta-jobs",
+            type=int,
+            default=1,
+            parse_from_config=True,
+            help="Number of processes to analyse the functions of a large file "
+            "in, when flake8 checks the file in its main process (default: 1)",
+        )
+
+        parser.add_option(
+            "--sta-diff",
+            default=None,
+            help="Only analyse the functions changed since this git revision "
+            "(e.g. origin/main) and the functions calling them",
+        )
+
+    @classmethod
+    def parse_options(cls, options: Any) -> None:
+        cls.stats = options.sta_stats
+        cls.matrix_threshold = options.sta_matrix_threshold
+        cls.demand = options.sta_demand
+        cls.jobs = options.sta_jobs
+        if options.sta_diff:
+            try:
+                cls.changed = changed_lines(options.sta_diff)
+            except ValueError as e:
+                option_error("--sta-diff", e)
+        if options.sta_levels:
+            try:
+                cls.levels = SecurityLattice(
+                    options.sta_levels, options.sta_compartments
+                )
+            except ValueError as e:
+                option_error("--sta-levels", e)
+        if options.sta_cache_db:
+            cls.cache = SharedCache(
+                options.sta_cache_db,
+                cls.version,
+                options.sta_cache_size * 1024 * 1024,
+            )
+        elif options.sta_cache_dir:
+            cls.cache = AnalysisCache(
+                options.sta_cache_dir,
+                cls.version,
+                options.sta_cache_size * 1024 * 1024,
+            )
 
     def run(self) -> Generator[Tuple[int, int, str, Type[Any]], None, None]:
-        errors = analyse(self._tree, self._lines)
+        changed: Optional[Set[int]] = None
+        if self.changed is not None:
+            changed = self.changed.get(os.path.realpath(self._filename))
+            if not changed:
+                # The file did not change
+                return
+        stats: Optional[List[FunctionStats]] = [] if self.stats else None
+        errors = analyse(
+            self._tree,
+            self._lines,
+            cache=self.cache,
+            stats=stats,
+            matrix_threshold=self.matrix_threshold,
+            tokens=self._tokens,
+            demand=self.demand,
+            levels=self.levels,
+            workers=self.jobs,
+            changed=changed,
+        )
+        if stats:
+            errors += [(r.line, r.col, format_stats(r)) for r in stats]
 
         for line, col, msg in errors:
             yield line, col, msg, type(self)
+
+
+def option_error(option: str, error: Exception) -> NoReturn:
+    """Exit like flake8 does for an invalid option value"""
+    print("flake8: error: argument {}: {}".format(option, error), file=sys.stderr)
+    raise SystemExit(2)
@@ -0,0 +1,337 @@
+# Core Library modules
+import ast
+import io
+import json
+import re
+import sys
+from typing import Any, BinaryIO, Dict, List, Optional, Set, Tuple
+
+# Local modules
+from .collector import FlowIndex, function_lines
+from .hoare import analyse
+from .typedefs import Errors
+
+# Lines defining functions or classes. Editing one of them may change which
+# function a call anywhere in the module refers to, so the whole document is
+# analysed again.
+DEFINITION = re.compile(r"\s*(async\s+def|def|class)\b")
+
+# Requests of the client the server answers, all other messages it handles
+# are notifications
+REQUESTS = ("initialize", "shutdown")
+
+# LSP constants
+INCREMENTAL_SYNC = 2
+WARNING = 2
+LOG_ERROR = 1
+METHOD_NOT_FOUND = -32601
+INTERNAL_ERROR = -32603
+
+
+class Document:
+    """An open text document. `tree`, `flow_index` and `errors` belong to
+    the text it had when it was last analysed, `analysed`; they are None
+    before the first analysis succeeded."""
+
+    def __init__(self, uri: str, text: str) -> None:
+        self.uri: str = uri
+        self.lines: List[str] = split_lines(text)
+        self.analysed: List[str] = []
+        self.tree: Optional[ast.Module] = None
+        self.flow_index: Optional[FlowIndex] = None
+        self.errors: Optional[Errors] = None
+
+    def edit(self, change: Dict[str, Any]) -> None:
+        """Apply a change of the text as sent with didChange"""
+        if "range" not in change:
+            self.lines = split_lines(change["text"])
+            return
+        start, end = change["range"]["start"], change["range"]["end"]
+        first = self.line(start["line"])
+        last = self.line(end["line"])
+        text = (
+            first[: utf16_index(first, start["character"])]
+            + change["text"]
+            + last[utf16_index(last, end["character"]) :]
+        )
+        self.lines[start["line"] : end["line"] + 1] = split_lines(text)
+
+    def line(self, index: int) -> str:
+        return self.lines[index] if index < len(self.lines) else ""
+
+
+def split_lines(text: str) -> List[str]:
+    """Lines of `text` with their line endings. Unlike str.splitlines, form
+    feeds and other separators do not end a line, neither for the protocol
+    nor for Python."""
+    return io.StringIO(text, newline="").readlines()
+
+
+def utf16_index(line: str, character: int) -> int:
+    """Index into `line` of the position `character` in UTF-16 code units"""
+    units = 0
+    for i, char in enumerate(line):
+        if units >= character:
+            return i
+        units += 2 if ord(char) > 0xFFFF else 1
+    return len(line)
+
+
+def utf16_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def edited(old: List[str], new: List[str]) -> Tuple[int, int, int]:
+    """Region of lines that differs between two versions of a text: its
+    first index and its ends in the old and the new version"""
+    start = 0
+    limit = min(len(old), len(new))
+    while start < limit and old[start] == new[start]:
+        start += 1
+    old_end, new_end = len(old), len(new)
+    while (
+        old_end > start and new_end > start and old[old_end - 1] == new[new_end - 1]
+    ):
+        old_end -= 1
+        new_end -= 1
+    return start, old_end, new_end
+
+
+class Server:
+    """Language server publishing the errors of the analysis of the open
+    python documents as diagnostics, over the Language Server Protocol on
+    `stdin` and `stdout`.
+
+    The tree, flow annotations and errors of the last analysis of every
+    document are kept. When a document is edited, only the outermost
+    functions containing the edited lines and the functions calling them are
+    analysed again (see `affected`); the errors of all other functions are
+    moved by the number of lines inserted or removed before them. `options`
+    are passed on to `analyse`."""
+
+    def __init__(
+        self, options: Dict[str, Any], stdin: BinaryIO, stdout: BinaryIO
+    ) -> None:
+        self.options: Dict[str, Any] = options
+        self.stdin: BinaryIO = stdin
+        self.stdout: BinaryIO = stdout
+        self.documents: Dict[str, Document] = {}
+        self.shutdown: bool = False
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        """Next message from the client, None at the end of the input"""
+        length = None
+        while True:
+            header = self.stdin.readline()
+            if not header:
+                return None
+            header = header.strip()
+            if not header:
+                if length is not None:
+                    break
+                continue
+            name, _, value = header.decode("ascii").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        return json.loads(self.stdin.read(length).decode("utf-8"))
+
+    def send(self, message: Dict[str, Any]) -> None:
+        message["jsonrpc"] = "2.0"
+        body = json.dumps(message).encode("utf-8")
+        self.stdout.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+        self.stdout.flush()
+
+    def serve(self) -> int:
+        """Handle messages until the client exits. Returns the exit code."""
+        while True:
+            message = self.read()
+            if message is None or message.get("method") == "exit":
+                return 0 if self.shutdown else 1
+            method = message.get("method")
+            if "id" in message and method not in REQUESTS:
+                if method is not None:
+                    self.error(message["id"], METHOD_NOT_FOUND, method)
+                continue
+            try:
+                result = self.handle(method, message.get("params"))
+            except Exception as e:
+                if "id" in message:
+                    self.error(message["id"], INTERNAL_ERROR, str(e))
+                else:
+                    self.log("{} failed: {}: {}".format(method, type(e).__name__, e))
+                continue
+            if "id" in message:
+                self.send({"id": message["id"], "result": result})
+
+    def error(self, id: Any, code: int, message: str) -> None:
+        self.send({"id": id, "error": {"code": code, "message": message}})
+
+    def log(self, message: str) -> None:
+        """Show an error message in the log of the client"""
+        self.send(
+            {
+                "method": "window/logMessage",
+                "params": {"type": LOG_ERROR, "message": message},
+            }
+        )
+
+    def handle(self, method: Optional[str], params: Any) -> Any:
+        if method == "initialize":
+            return {
+                "capabilities": {
+                    "textDocumentSync": {
+                        "openClose": True,
+                        "change": INCREMENTAL_SYNC,
+                    }
+                },
+                "serverInfo": {"name": "staticinflowanalysis"},
+            }
+        if method == "shutdown":
+            self.shutdown = True
+            return None
+        document: Optional[Document]
+        if method == "textDocument/didOpen":
+            item = params["textDocument"]
+            if item.get("languageId", "python") == "python":
+                document = Document(item["uri"], item["text"])
+                self.documents[document.uri] = document
+                self.check(document)
+        elif method == "textDocument/didChange":
+            document = self.documents.get(params["textDocument"]["uri"])
+            if document is not None:
+                for change in params["contentChanges"]:
+                    document.edit(change)
+                self.check(document)
+        elif method == "textDocument/didClose":
+            document = self.documents.pop(params["textDocument"]["uri"], None)
+            if document is not None:
+                self.publish(document.uri, [], [])
+        return None
+
+    def check(self, document: Document) -> None:
+        """Analyse the document again and publish its errors"""
+        lines = document.lines
+        old = document.errors
+        start, old_end, new_end = edited(document.analysed, lines)
+        if old is not None and start == old_end == new_end:
+            # Nothing changed since the last analysis
+            return
+        try:
+            tree = self.parse(document, start, old_end, new_end)
+        except (SyntaxError, ValueError):
+            # Most likely in the middle of typing, the last errors stay
+            return
+
+        incremental = old is not None and not any(
+            DEFINITION.match(line)
+            for line in document.analysed[start:old_end] + lines[start:new_end]
+        )
+        # The document keeps the index and tree of the analysed text until
+        # the analysis of the new one succeeded
+        flow_index = None
+        if document.flow_index is not None:
+            flow_index = document.flow_index.edited(lines, start, old_end, new_end)
+        if flow_index is None:
+            flow_index = FlowIndex(lines, levels=self.options.get("levels"))
+
+        if old is None or not incremental or not flow_index:
+            errors: Errors = analyse(tree, lines, flow_index=flow_index, **self.options)
+        else:
+            # Lines only removed count as a change of the line before them
+            changed: Set[int] = set(range(start + 1, new_end + 1))
+            if not changed:
+                changed.add(max(start, 1))
+            selected: List[ast.FunctionDef] = []
+            errors = analyse(
+                tree,
+                lines,
+                changed=changed,
+                selected=selected,
+                flow_index=flow_index,
+                **self.options,
+            )
+            spans = [function_lines(node) for node in selected]
+            shift = new_end - old_end
+            for line, col, msg in old:
+                if line > old_end:
+                    line += shift
+                elif line > start:
+                    # In the edited lines, their functions are analysed again
+                    continue
+                if not any(line in span for span in spans):
+                    errors.append((line, col, msg))
+        errors.sort()
+
+        document.analysed = list(lines)
+        document.tree = tree
+        document.flow_index = flow_index
+        document.errors = errors
+        self.publish(document.uri, lines, errors)
+
+    def parse(
+        self, document: Document, start: int, old_end: int, new_end: int
+    ) -> ast.Module:
+        """Tree of the current text of the document, after the lines with
+        indices `start` to `old_end` of the text it was last analysed with
+        were replaced by those from `start` to `new_end`. If as many lines
+        were replaced inside of a single top-level function, only that
+        function is parsed again, into a copy of the module's tree."""
+        lines = document.lines
+        tree = document.tree
+        if tree is not None and old_end == new_end:
+            for i, node in enumerate(tree.body):
+                if not isinstance(node, ast.FunctionDef):
+                    continue
+                first = min([node.lineno] + [d.lineno for d in node.decorator_list])
+                last = function_lines(node).stop - 1
+                if first > start + 1:
+                    break
+                if old_end > last:
+                    continue
+                try:
+                    body = ast.parse("".join(lines[first - 1 : last])).body
+                except (SyntaxError, ValueError):
+                    break
+                if (
+                    len(body) == 1
+                    and isinstance(body[0], ast.FunctionDef)
+                    and function_lines(body[0]).stop == last - first + 2
+                ):
+                    ast.increment_lineno(body[0], first - 1)
+                    return ast.Module(
+                        body=tree.body[:i] + body + tree.body[i + 1 :],
+                        type_ignores=tree.type_ignores,
+                    )
+                break
+        return ast.parse("".join(lines))
+
+    def publish(self, uri: str, lines: List[str], errors: Errors) -> None:
+        diagnostics: List[Dict[str, Any]] = []
+        for line, col, msg in errors:
+            text = lines[line - 1] if 0 < line <= len(lines) else ""
+            # Columns of the analysis are byte offsets of the UTF-8 encoded line
+            character = utf16_length(
+                text.encode("utf-8")[:col].decode("utf-8", "ignore")
+            )
+            code, _, message = msg.partition(" ")
+            position = {"line": line - 1, "character": character}
+            diagnostics.append(
+                {
+                    "range": {"start": position, "end": position},
+                    "severity": WARNING,
+                    "code": code,
+                    "source": "staticinflowanalysis",
+                    "message": message,
+                }
+            )
+        self.send(
+            {
+                "method": "textDocument/publishDiagnostics",
+                "params": {"uri": uri, "diagnostics": diagnostics},
+            }
+        )
+
+
+def serve(options: Dict[str, Any]) -> int:
+    """Run a language server on the standard input and output"""
+    return Server(options, sys.stdin.buffer, sys.stdout.buffer).serve()
@@ -0,0 +1,89 @@
+# Core Library modules
+import ast
+import time
+from typing import Any, List, NamedTuple
+
+STA900 = (
+    "STA900 Analysed function '{name}' in {time:.2f} ms: {loop_passes} loop "
+    "passes, {copies} state copies, {variables} variables, largest "
+    "independency set {peak_indeps}".format
+)
+
+
+class FunctionStats(NamedTuple):
+    """Instrumentation record of the analysis of a single function. Nested
+    functions have records of their own and are not included."""
+
+    name: str
+    line: int
+    col: int
+    # Wall time in seconds
+    time: float
+    # Passes over loop bodies: one per loop with the AST engine, which
+    # summarises a loop in a single pass, one per visit of a loop guard with
+    # the CFG engine
+    loop_passes: int
+    # Copies of the analysis state (loops and branches)
+    copies: int
+    # Size of the largest independency set assigned (after the loop for the
+    # variables assigned in a loop)
+    peak_indeps: int
+    # Size of the variable universe
+    variables: int
+
+
+class Profiler:
+    """Collects a FunctionStats record for every function a Hoare instance
+    analyses"""
+
+    def __init__(self) -> None:
+        self.records: List[FunctionStats] = []
+        # Start time, loop passes and copies, totals of nested functions and
+        # the largest independency set of every function being analysed
+        self._frames: List[List[Any]] = []
+
+    def enter(self, hoare: Any) -> None:
+        self._frames.append(
+            [time.perf_counter(), hoare.loop_passes, hoare.copies, 0.0, 0, 0, 0]
+        )
+
+    def observe(self, size: int) -> None:
+        """Record the size of an assigned independency set"""
+        frame = self._frames[-1]
+        frame[6] = max(frame[6], size)
+
+    def exit(self, hoare: Any, node: ast.FunctionDef) -> None:
+        start, loop_passes, copies, n_time, n_loop_passes, n_copies, peak = (
+            self._frames.pop()
+        )
+        elapsed = time.perf_counter() - start
+        loop_passes = hoare.loop_passes - loop_passes
+        copies = hoare.copies - copies
+        if self._frames:
+            parent = self._frames[-1]
+            parent[3] += elapsed
+            parent[4] += loop_passes
+            parent[5] += copies
+        self.records.append(
+            FunctionStats(
+                name=node.name,
+                line=node.lineno,
+                col=node.col_offset,
+                time=elapsed - n_time,
+                loop_passes=loop_passes - n_loop_passes,
+                copies=copies - n_copies,
+                peak_indeps=peak,
+                variables=len(hoare.all_vars),
+            )
+        )
+
+
+def format_stats(record: FunctionStats) -> str:
+    return STA900(
+        name=record.name,
+        time=record.time * 1000,
+        loop_passes=record.loop_passes,
+        copies=record.copies,
+        variables=record.variables,
+        peak_indeps=record.peak_indeps,
+    )
@@ -0,0 +1,293 @@
+# Core Library modules
+import ast
+import bisect
+import re
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+)
+
+# Local modules
+from .collector import (
+    collect_free_variables,
+    collect_functions,
+    function_lines,
+    function_parameters,
+)
+from .typedefs import Variables
+
+# Function a name is looked up in, None for the module
+Scope = Optional[ast.FunctionDef]
+
+
+class CallGraph:
+    """Calls between the functions of a module, as far as they can be
+    resolved statically: calls by the name of a function defined in an
+    enclosing scope (or the module) that is not shadowed by a parameter."""
+
+    def __init__(self, tree: ast.AST) -> None:
+        self.tree: Optional[ast.AST] = tree
+        # Functions defined directly in a scope by name, None if the name is
+        # defined more than once
+        self.defs: Dict[Scope, Dict[str, Optional[ast.FunctionDef]]] = {}
+        self.parents: Dict[ast.FunctionDef, Scope] = {}
+        # Names of all functions defined in the module
+        self.names: Set[str] = set()
+        self._callees: Dict[ast.FunctionDef, List[ast.FunctionDef]] = {}
+
+    def _scan(self, node: ast.AST, scope: Scope, in_class: bool) -> None:
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, ast.FunctionDef):
+                if not in_class:
+                    # Methods are not visible by their bare name
+                    defs = self.defs.setdefault(scope, {})
+                    defs[child.name] = None if child.name in defs else child
+                self.parents[child] = scope
+                self.names.add(child.name)
+                self._scan(child, child, False)
+            elif isinstance(child, ast.ClassDef):
+                self._scan(child, scope, True)
+            elif hasattr(child, "body") and not isinstance(child, ast.expr):
+                # Compound statements, exception handlers and match cases
+                self._scan(child, scope, in_class)
+
+    def resolve(self, call: ast.Call, scope: Scope) -> Optional[ast.FunctionDef]:
+        """Function definition a call inside of `scope` refers to, if it
+        calls a function of this module by name"""
+        if self.tree is not None:
+            # The definitions are only collected once a call needs them
+            self._scan(self.tree, None, False)
+            self.tree = None
+        if not isinstance(call.func, ast.Name) or call.func.id not in self.names:
+            return None
+        name = call.func.id
+        while True:
+            defs = self.defs.get(scope)
+            if defs and name in defs:
+                return defs[name]
+            if scope is None:
+                return None
+            if any(arg.arg == name for arg in function_parameters(scope)):
+                return None
+            scope = self.parents.get(scope)
+
+    def callees(self, node: ast.FunctionDef) -> List[ast.FunctionDef]:
+        """Functions of this module called in the body of `node`, without the
+        calls in nested function definitions"""
+        if node not in self._callees:
+            callees: Dict[ast.FunctionDef, None] = {}
+            stack: List[ast.AST] = list(node.body)
+            while stack:
+                child = stack.pop()
+                if isinstance(child, ast.FunctionDef):
+                    continue
+                if isinstance(child, ast.Call):
+                    callee = self.resolve(child, node)
+                    if callee is not None:
+                        callees[callee] = None
+                stack.extend(ast.iter_child_nodes(child))
+            self._callees[node] = list(callees)
+        return self._callees[node]
+
+
+class Summaries(CallGraph):
+    """Memoized dependency summaries of the functions of a module.
+
+    The summary of a function is the set of its parameters the return value
+    depends on (rebinding a parameter is not visible to the caller, so the
+    return value is all a caller can observe). Summaries are computed on
+    demand, for the strongly connected components of the call graph in
+    topological order, so that every function is analysed once unless it is
+    (mutually) recursive, in which case its component is iterated until the
+    summaries are stable.
+
+    `analyser` creates the Hoare instance a function is summarised with from
+    the summaries."""
+
+    def __init__(
+        self, tree: ast.AST, analyser: Callable[["Summaries"], Any]
+    ) -> None:
+        super().__init__(tree)
+        self.analyser: Callable[["Summaries"], Any] = analyser
+        self.summaries: Dict[ast.FunctionDef, FrozenSet[str]] = {}
+
+    def components(self, root: ast.FunctionDef) -> List[List[ast.FunctionDef]]:
+        """Strongly connected components of the functions reachable from
+        `root` that have no summary yet, callees before their callers
+        (Tarjan's algorithm)"""
+        index: Dict[ast.FunctionDef, int] = {root: 0}
+        low: Dict[ast.FunctionDef, int] = {root: 0}
+        stack: List[ast.FunctionDef] = [root]
+        on_stack = {root}
+        components: List[List[ast.FunctionDef]] = []
+        work = [(root, iter(self.callees(root)))]
+        while work:
+            node, callees = work[-1]
+            for callee in callees:
+                if callee in self.summaries:
+                    continue
+                if callee not in index:
+                    index[callee] = low[callee] = len(index)
+                    stack.append(callee)
+                    on_stack.add(callee)
+                    work.append((callee, iter(self.callees(callee))))
+                    break
+                if callee in on_stack:
+                    low[node] = min(low[node], index[callee])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component: List[ast.FunctionDef] = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member is node:
+                            break
+                    components.append(component)
+        return components
+
+    def summary(self, node: ast.FunctionDef) -> FrozenSet[str]:
+        """Parameters of `node` its return value depends on"""
+        if node not in self.summaries:
+            for component in self.components(node):
+                self.solve(component)
+        return self.summaries[node]
+
+    def solve(self, component: List[ast.FunctionDef]) -> None:
+        recursive = len(component) > 1 or component[0] in self.callees(
+            component[0]
+        )
+        # Calls inside of the component start out without any dependencies
+        # and grow until nothing changes
+        for node in component:
+            self.summaries[node] = frozenset()
+        changed = True
+        while changed:
+            changed = False
+            for node in component:
+                hoare = self.analyser(self)
+                summary = self.summaries[node] | hoare.summarise(node)
+                if summary != self.summaries[node]:
+                    self.summaries[node] = summary
+                    changed = recursive
+
+    def arguments(self, call: ast.Call, callee: ast.FunctionDef) -> List[ast.expr]:
+        """Arguments of the call the return value of `callee` depends on"""
+        summary = self.summary(callee)
+        args = callee.args
+        positional = [
+            arg.arg for arg in getattr(args, "posonlyargs", []) + args.args
+        ]
+        keywords = {arg.arg for arg in args.args + args.kwonlyargs}
+        result: List[ast.expr] = []
+        for i, arg in enumerate(call.args):
+            if isinstance(arg, ast.Starred):
+                # Unknown mapping of arguments to parameters
+                return call.args + [kw.value for kw in call.keywords]
+            if i < len(positional):
+                param: Optional[str] = positional[i]
+            else:
+                param = args.vararg.arg if args.vararg else None
+            if param is None or param in summary:
+                result.append(arg)
+        for kw in call.keywords:
+            if kw.arg is None:
+                return call.args + [kw.value for kw in call.keywords]
+            if kw.arg in keywords:
+                param = kw.arg
+            else:
+                param = args.kwarg.arg if args.kwarg else None
+            if param is None or param in summary:
+                result.append(kw.value)
+        return result
+
+    def free_variables(self, tree: ast.AST, scope: Scope) -> Variables:
+        """Free variables of an expression inside of `scope`. Calls of
+        functions defined in the module only contribute the arguments their
+        return value depends on."""
+
+        def arguments(call: ast.Call) -> List[ast.expr]:
+            callee = self.resolve(call, scope)
+            return call.args if callee is None else self.arguments(call, callee)
+
+        return collect_free_variables(tree, arguments)
+
+    def signature(self, node: ast.FunctionDef) -> str:
+        """Summaries of all functions called from `node` and the functions
+        nested in it, as far as the analysis of `node` depends on them"""
+        parts: List[str] = []
+        for func in functions(node):
+            for callee in self.callees(func):
+                parts.append(
+                    "{}({}):{}".format(
+                        callee.name,
+                        ",".join(arg.arg for arg in function_parameters(callee)),
+                        ",".join(sorted(self.summary(callee))),
+                    )
+                )
+        return ";".join(sorted(parts))
+
+
+def functions(node: ast.FunctionDef) -> Iterator[ast.FunctionDef]:
+    """The given function and all function definitions nested in it"""
+    for child in ast.walk(node):
+        if isinstance(child, ast.FunctionDef):
+            yield child
+
+
+def affected(
+    tree: ast.AST,
+    lines: Sequence[str],
+    changed: Iterable[int],
+    calls: Optional[CallGraph],
+) -> Set[ast.FunctionDef]:
+    """Outermost functions of the module whose results may depend on the
+    `changed` lines: the functions containing one of them and, with the
+    `calls` of the module, the functions calling those directly or
+    indirectly (their summaries may have changed)."""
+    linenos = sorted(set(changed))
+
+    def touched(node: ast.FunctionDef) -> bool:
+        span = function_lines(node)
+        i = bisect.bisect_left(linenos, span.start)
+        return i < len(linenos) and linenos[i] < span.stop
+
+    outermost = collect_functions(tree)
+    selected = {node for node in outermost if touched(node)}
+    if calls is None:
+        return selected
+    # Nested functions can only be called from within the function they are
+    # nested in, the callers of changed functions elsewhere in the module
+    # call one of the selected outermost functions
+    names = {node.name for node in selected}
+    while names:
+        # Only functions mentioning one of the names can call them, which is
+        # a lot cheaper to find in the source than in the tree
+        pattern = re.compile(r"\b({})\b".format("|".join(map(re.escape, names))))
+        names = set()
+        for node in outermost:
+            if node in selected:
+                continue
+            span = function_lines(node)
+            if not pattern.search("".join(lines[span.start - 1 : span.stop - 1])):
+                continue
+            if any(
+                callee in selected
+                for func in functions(node)
+                for callee in calls.callees(func)
+            ):
+                selected.add(node)
+                names.add(node.name)
+    return selected
@@ -0,0 +1,177 @@
+# Core Library modules
+from typing import Any, Dict, List
+
+# Local modules
+from .lattice import Lattice
+from .typedefs import Bitset, Variables
+
+
+class Transfer:
+    """Dependency set of a variable after running a loop body once: the
+    variables it depends on at the start of the iteration (`pre`, a bitmask)
+    and an element of the enclosing lattice it depends on regardless of
+    them (`const`, e.g. the context of the loop). Elements are compared with
+    TransferLattice.equal."""
+
+    __slots__ = ("pre", "const")
+
+    def __init__(self, pre: Bitset, const: Any) -> None:
+        self.pre: Bitset = pre
+        self.const: Any = const
+
+    def __or__(self, other: "Transfer") -> "Transfer":
+        return Transfer(self.pre | other.pre, self.const | other.const)
+
+
+class TransferState:
+    """Copy-on-write transfer relation, indexed by variable position. Rows
+    that were never written are the identity (the variable keeps its
+    value), so a loop body only costs for the variables it assigns."""
+
+    __slots__ = ("rows", "const", "_shared")
+
+    def __init__(self, rows: Dict[int, Transfer], const: Any) -> None:
+        self.rows: Dict[int, Transfer] = rows
+        # Empty element of the base lattice
+        self.const: Any = const
+        self._shared: bool = False
+
+    def __getitem__(self, i: int) -> Transfer:
+        row = self.rows.get(i)
+        return Transfer(1 << i, self.const) if row is None else row
+
+    def __setitem__(self, i: int, row: Transfer) -> None:
+        if self._shared:
+            self.rows = dict(self.rows)
+            self._shared = False
+        self.rows[i] = row
+
+    def snapshot(self) -> "TransferState":
+        self._shared = True
+        copy = TransferState(self.rows, self.const)
+        copy._shared = True
+        return copy
+
+
+class TransferLattice(Lattice):
+    """Lattice the body of a loop is run in once to compile it into a
+    transfer relation.
+
+    Every assignment, branch and nested loop in the body unions dependency
+    sets, so the effect of one iteration on the state D of the enclosing
+    `base` lattice is D'(x) = U{D(y) | y in M(x)} | c(x). Starting from
+    the state where every variable only depends on its own value at the
+    start of the iteration, running the body yields M (the `pre` masks) and
+    c (the `const` elements). Elements are dependency sets, as in the
+    DependencyLattice."""
+
+    def __init__(self, universe: Variables, base: Lattice) -> None:
+        self.all_vars: Variables = universe
+        self.base: Lattice = base
+        # Share the interned variable positions of the base lattice
+        self.names: List[str] = getattr(base, "names", None) or sorted(universe)
+        self.index: Dict[str, int] = getattr(base, "index", None) or {
+            x: i for i, x in enumerate(self.names)
+        }
+        self.base_empty: Any = base.empty()
+
+    def initial(self) -> TransferState:
+        return TransferState({}, self.base_empty)
+
+    def empty(self) -> Transfer:
+        return Transfer(0, self.base_empty)
+
+    def encode(self, names: Variables) -> Transfer:
+        # Contexts built from names (augmented assignments) refer to the
+        # initial values of the function, they are constants of the loop
+        return Transfer(0, self.base.encode(names))
+
+    def constant(self, element: Any) -> Transfer:
+        """Embed an element of the base lattice"""
+        return Transfer(0, element)
+
+    def copy(self, state: TransferState) -> TransferState:
+        return state.snapshot()
+
+    def indeps(self, state: TransferState, free_vars: Variables) -> Any:
+        raise NotImplementedError("transfer relations only track dependencies")
+
+    def deps(self, state: TransferState, free_vars: Variables) -> Transfer:
+        pre = 0
+        const = self.base_empty
+        rows = state.rows
+        for x in free_vars:
+            i = self.index[x]
+            row = rows.get(i)
+            if row is None:
+                pre |= 1 << i
+            else:
+                pre |= row.pre
+                const = const | row.const
+        return Transfer(pre, const)
+
+    def assign(
+        self,
+        state: TransferState,
+        var: str,
+        free_vars: Variables,
+        context: Transfer,
+    ) -> None:
+        state[self.index[var]] = self.deps(state, free_vars) | context
+
+    def join(self, s1: TransferState, s2: TransferState) -> TransferState:
+        if s1.rows is s2.rows:
+            return s1.snapshot()
+        return TransferState(
+            {i: s1[i] | s2[i] for i in s1.rows.keys() | s2.rows.keys()},
+            self.base_empty,
+        )
+
+    def independent(self, state: TransferState, var: str, other: str) -> bool:
+        return not state[self.index[var]].pre >> self.index[other] & 1
+
+    def size(self, state: TransferState, var: str) -> int:
+        return len(self.names) - bin(state[self.index[var]].pre).count("1")
+
+    def equal(self, e1: Transfer, e2: Transfer) -> bool:
+        return e1.pre == e2.pre and self.base.equal(e1.const, e2.const)
+
+    def close(self, relation: TransferState, state: Any) -> Any:
+        """Apply the transfer relation of a loop body, iterated any number
+        of times, to the `state` of the base lattice before the loop.
+
+        The fixpoint of D = D0 | F(D) is M*(D0) | M*(c) with M* the reflexive
+        transitive closure of M, computed with Warshall's algorithm over the
+        variables the body assigns (all others are their own only
+        successor)."""
+        base = self.base
+        changed = sorted(relation.rows)
+        pre: Dict[int, Bitset] = {i: relation[i].pre | 1 << i for i in changed}
+        for k in changed:
+            bit, row = 1 << k, pre[k]
+            for i in changed:
+                if pre[i] & bit:
+                    pre[i] |= row
+
+        # Rows with the same constant (typically the context of the loop)
+        # share the element, group them to a mask per element
+        consts: Dict[int, List[Any]] = {}
+        for j in changed:
+            const = relation.rows[j].const
+            if const is not self.base_empty:
+                consts.setdefault(id(const), [const, 0])[1] |= 1 << j
+
+        result = base.copy(state)
+        for i in changed:
+            names = set()
+            mask = pre[i]
+            while mask:
+                low = mask & -mask
+                names.add(self.names[low.bit_length() - 1])
+                mask ^= low
+            value = base.deps(state, names)
+            for const, rows in consts.values():
+                if pre[i] & rows:
+                    value = value | const
+            base.assign(result, self.names[i], set(), value)
+        return result
@@ -1,5 +1,5 @@
 # Core Library modules
-from typing import Dict, Set, List, Tuple, Callable
+from typing import Dict, Set, List, NamedTuple, Tuple, Callable, Union
 from enum import Enum
 
 
@@ -9,8 +9,27 @@ class Confidentiality(Enum):
     NA = "None"
 
 
+class Label(NamedTuple):
+    """Label of a configured security lattice. `mask` has a bit for every
+    level below or equal to the label's level and for every compartment of
+    the label, so that a label flows to another one iff its bits are a
+    subset of the other's."""
+
+    name: str
+    mask: int
+
+    @property
+    def value(self) -> str:
+        return "{}={}".format(self.name, self.mask)
+
+    def flows_to(self, other: "Label") -> bool:
+        return not self.mask & ~other.mask
+
+
 Variables = Set[str]
 Indeps = Dict[str, Set[str]]
+Bitset = int
 Errors = List[Tuple[int, int, str]]
-FlowConfig = Dict[str, List[Confidentiality]]
-ErrorCode = Callable[[str, str, str, str], str]
+Annotation = Union[Confidentiality, Label]
+FlowConfig = Dict[str, List[Annotation]]
+ErrorCode = Callable[..., str]
@@ -0,0 +1,135 @@
+# Core Library modules
+import random
+from typing import Dict, List
+
+LABELS = ("High", "Low", "None")
+
+
+class Generator:
+    """Seeded generator of programs exercising all of the analysis: flow
+    annotations (some of them invalid), branches, loops, nested functions,
+    copies of variables, tuple assignments and calls of the functions of the
+    module, including recursive ones"""
+
+    def __init__(self, seed: int, functions: int = 4, variables: int = 8) -> None:
+        self.rng = random.Random(seed)
+        self.functions = functions
+        self.variables = ["v{}".format(i) for i in range(variables)]
+        # Variables only assigned once, from another variable
+        self.copies: List[str] = []
+        self.params: Dict[str, List[str]] = {}
+        self.lines: List[str] = []
+
+    def emit(self, indent: int, line: str) -> None:
+        self.lines.append("    " * indent + line)
+
+    def operands(self, count: int) -> List[str]:
+        names = self.variables + self.copies
+        return self.rng.sample(names, min(count, len(names)))
+
+    def expr(self) -> str:
+        r = self.rng.random()
+        if r < 0.15:
+            return str(self.rng.randint(0, 9))
+        if r < 0.35:
+            name = self.rng.choice(sorted(self.params))
+            args = self.operands(len(self.params[name]))
+            if self.rng.random() < 0.2:
+                return "{}({})".format(
+                    name,
+                    ", ".join(
+                        "{}={}".format(param, arg)
+                        for param, arg in zip(self.params[name], args)
+                    ),
+                )
+            return "{}({})".format(name, ", ".join(args))
+        return " + ".join(self.operands(self.rng.randint(1, 3)))
+
+    def annotation(self) -> str:
+        if self.rng.random() < 0.02:
+            return "Secret"
+        return self.rng.choice(LABELS[:2])
+
+    def block(self, indent: int, depth: int) -> None:
+        for _ in range(self.rng.randint(1, 5)):
+            r = self.rng.random()
+            target = self.rng.choice(self.variables)
+            if depth and r < 0.15:
+                self.emit(indent, "if {} > 1:".format(self.expr()))
+                self.block(indent + 1, depth - 1)
+                if self.rng.random() < 0.5:
+                    self.emit(indent, "else:")
+                    self.block(indent + 1, depth - 1)
+            elif depth and r < 0.22:
+                self.emit(indent, "while {} > 1:".format(self.expr()))
+                self.block(indent + 1, depth - 1)
+            elif depth and r < 0.28:
+                self.emit(indent, "for {} in range({}):".format(target, self.expr()))
+                self.block(indent + 1, depth - 1)
+            elif depth and r < 0.31:
+                self.nested(indent, depth - 1)
+            elif r < 0.36:
+                self.emit(indent, "return {}".format(self.expr()))
+                return
+            elif r < 0.42:
+                self.emit(indent, "{} += {}".format(target, self.expr()))
+            elif r < 0.5:
+                self.emit(
+                    indent,
+                    "{} = {}  # flow: {}".format(
+                        target, self.expr(), self.annotation()
+                    ),
+                )
+            elif r < 0.55:
+                self.emit(
+                    indent,
+                    "{}, {} = {}, {}".format(
+                        target, self.rng.choice(self.variables), *self.operands(2)
+                    ),
+                )
+            else:
+                self.emit(indent, "{} = {}".format(target, self.expr()))
+
+    def nested(self, indent: int, depth: int) -> None:
+        params = self.operands(self.rng.randint(1, 3))
+        labels = [self.rng.choice(LABELS) for _ in params]
+        self.emit(
+            indent,
+            "def inner{}({}):  # flow: {}".format(
+                len(self.lines), ", ".join(params), ", ".join(labels)
+            ),
+        )
+        self.block(indent + 1, depth)
+        self.emit(indent + 1, "return {}".format(self.expr()))
+
+    def function(self, name: str) -> None:
+        params = self.params[name]
+        header = "def {}({}):".format(name, ", ".join(params))
+        if self.rng.random() < 0.8:
+            labels = [self.rng.choice(LABELS) for _ in params]
+            header += "  # flow: " + ", ".join(labels)
+        self.emit(0, header)
+        self.copies = []
+        for i in range(self.rng.randint(0, 3)):
+            copy = "c{}".format(i)
+            self.emit(1, "{} = {}".format(copy, self.rng.choice(self.variables)))
+            self.copies.append(copy)
+        self.block(1, 3)
+        self.emit(1, "return {}".format(self.expr()))
+        self.emit(0, "")
+        self.emit(0, "")
+
+    def module(self) -> str:
+        self.params = {
+            "f{}".format(i): self.variables[: self.rng.randint(1, 4)]
+            for i in range(self.functions)
+        }
+        self.lines = []
+        for name in sorted(self.params):
+            self.function(name)
+        return "\n".join(self.lines) + "\n"
+
+
+def generate(seed: int, functions: int = 4, variables: int = 8) -> str:
+    """Generate the source code of a module"""
+    return Generator(seed, functions, variables).module()
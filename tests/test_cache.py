@@ -0,0 +1,41 @@
+# Core Library modules
+import ast
+import pathlib
+from typing import Callable
+
+# Third party modules
+import pytest
+
+# First party modules
+from staticinflowanalysis.cache import AnalysisCache, Cache, SharedCache
+from staticinflowanalysis.collector import FlowIndex
+
+SOURCE = """\
+def f(h, l):  # flow: High, Low
+    l = h
+"""
+
+CACHES = [
+    lambda path: AnalysisCache(str(path / "cache"), "1.0", max_size=1024),
+    lambda path: SharedCache(str(path / "cache.db"), "1.0", max_size=1024),
+]
+
+
+@pytest.mark.parametrize("make", CACHES, ids=["files", "sqlite"])
+def test_cache(tmp_path: pathlib.Path, make: Callable[[pathlib.Path], Cache]) -> None:
+    """Entries are relative to the function, and evicted once the cache is
+    too large"""
+    cache = make(tmp_path)
+    tree = ast.parse(SOURCE)
+    node = tree.body[0]
+    assert isinstance(node, ast.FunctionDef)
+    key = cache.key(node, FlowIndex(SOURCE.splitlines(True)))
+    assert cache.get(key, node) is None
+    cache.put(key, node, [(2, 4, "STA100 flow")])
+    # The function moved down by two lines
+    node.lineno += 2
+    assert cache.get(key, node) == [(4, 4, "STA100 flow")]
+
+    for i in range(100):
+        cache.put(str(i), node, [(3, 0, "STA100 " + "x" * 20)])
+    assert 0 < sum(size for _, _, size in cache.entries()) <= 1024
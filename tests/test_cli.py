@@ -0,0 +1,54 @@
+# Core Library modules
+import ast
+import pathlib
+from typing import Any
+
+# Third party modules
+import pytest
+
+# First party modules
+from staticinflowanalysis import cli
+from staticinflowanalysis.hoare import analyse
+
+SOURCE = """\
+def f(h, l):  # flow: High, Low
+{}
+    s = "{}"
+    l = h  # flow: High
+    return l
+"""
+
+
+def test_line_separators(tmp_path: pathlib.Path) -> None:
+    """Form feeds and line separators do not end a line of the file"""
+    path = tmp_path / "module.py"
+    path.write_text(SOURCE.format("\x0c", "\u2028"), encoding="utf-8")
+    plain = SOURCE.format("", " ")
+    cli.init_worker({})
+    assert cli.check_file(str(path)) == (
+        str(path),
+        sorted(analyse(ast.parse(plain), plain.splitlines(True))),
+    )
+
+
+@pytest.mark.parametrize(
+    "error, code", [(RuntimeError("broken"), "STA002"), (OSError("full"), "E902")]
+)
+def test_failing_analysis(
+    monkeypatch: pytest.MonkeyPatch,
+    tmp_path: pathlib.Path,
+    error: Exception,
+    code: str,
+) -> None:
+    """Bugs of the analysis are not reported as files that cannot be read"""
+
+    def fail(*args: Any, **kwargs: Any) -> None:
+        raise error
+
+    path = tmp_path / "module.py"
+    path.write_text(SOURCE.format("", ""), encoding="utf-8")
+    monkeypatch.setattr(cli, "analyse", fail)
+    cli.init_worker({})
+    [(line, col, msg)] = cli.check_file(str(path))[1]
+    assert msg.split()[0] == code
+    assert str(error) in msg
@@ -0,0 +1,71 @@
+# Core Library modules
+import random
+
+# First party modules
+from staticinflowanalysis.collector import FlowIndex
+from staticinflowanalysis.typedefs import Confidentiality
+
+# Local modules
+from programs import generate
+
+EDITS = [
+    "    v1 = v2\n",
+    "    v1 = v2  # flow: High\n",
+    "    v3 = v0  # flow: Low\n",
+    "    v2 = 1  # flow: Secret\n",
+    "def g(v0, v1):  # flow: Low, High\n",
+    "\n",
+]
+
+
+def test_invalid() -> None:
+    index = FlowIndex(["def f(a, b):  # flow: High, Secret\n", "    a = b\n"])
+    assert not index
+    assert list(index.invalid) == [1]
+    assert "Secret" in index.invalid[1]
+
+
+def test_annotations() -> None:
+    index = FlowIndex(
+        [
+            "def f(a, b):  # flow: High, Low\n",
+            '    s = """\n',
+            "    # flow: High\n",
+            '    """\n',
+            "    a = b  # flow: Low\n",
+        ]
+    )
+    assert index.configs == {
+        1: [Confidentiality.High, Confidentiality.Low],
+        5: [Confidentiality.Low],
+    }
+    assert index.annotated_lines(range(1, 5)) == [1]
+    assert index.annotated(range(2, 6))
+    assert not index.annotated(range(2, 5))
+
+
+def test_edited() -> None:
+    """The index of an edited text is the index of the text"""
+    rng = random.Random(0)
+    for seed in range(50):
+        lines = generate(seed).splitlines(True)
+        index = FlowIndex(lines)
+        for _ in range(10):
+            start = rng.randrange(len(lines) + 1)
+            old_end = min(len(lines), start + rng.randint(0, 3))
+            new = [rng.choice(EDITS) for _ in range(rng.randint(0, 3))]
+            lines = lines[:start] + new + lines[old_end:]
+            edited = index.edited(lines, start, old_end, start + len(new))
+            assert edited is not None
+            index = FlowIndex(lines)
+            assert edited.configs == index.configs
+            assert edited.invalid == index.invalid
+            assert edited.linenos == index.linenos
+
+
+def test_edited_strings() -> None:
+    """Strings spanning lines need the whole text to find the comments"""
+    lines = ["def f(a):  # flow: High\n", "    return a\n"]
+    index = FlowIndex(lines)
+    lines = lines[:1] + ['    s = """\n', '    # flow: Low\n', '    """\n'] + lines[1:]
+    assert index.edited(lines, 1, 1, 4) is None
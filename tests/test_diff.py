@@ -0,0 +1,32 @@
+# Core Library modules
+import os
+import pathlib
+
+# First party modules
+from staticinflowanalysis.diff import changed_lines, git
+
+
+def commit(repo: pathlib.Path, name: str, text: str) -> None:
+    (repo / name).write_text(text)
+    git(["add", name], str(repo))
+    git(
+        ["-c", "user.name=test", "-c", "user.email=test@test", "commit", "-qm", name],
+        str(repo),
+    )
+
+
+def test_changed_lines(tmp_path: pathlib.Path) -> None:
+    """Untracked files only count for the working tree, not for a range of
+    commits"""
+    repo = tmp_path
+    git(["init", "-q"], str(repo))
+    commit(repo, "a.py", "a = 1\nb = 2\nc = 3\n")
+    base = git(["rev-parse", "HEAD"], str(repo)).strip()
+    commit(repo, "a.py", "a = 1\nb = 20\nc = 3\n")
+    (repo / "a.py").write_text("a = 10\nb = 20\nc = 3\n")
+    (repo / "new.py").write_text("x = 1\n")
+    path = os.path.realpath(str(repo / "a.py"))
+    new = os.path.realpath(str(repo / "new.py"))
+
+    assert changed_lines(base, str(repo)) == {path: {1, 2}, new: {1, 2}}
+    assert changed_lines(base + "...HEAD", str(repo)) == {path: {2}}
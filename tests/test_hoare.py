@@ -0,0 +1,99 @@
+# Core Library modules
+import ast
+import random
+from typing import Any, Dict, List
+
+# Third party modules
+import pytest
+
+# First party modules
+from staticinflowanalysis import hoare
+from staticinflowanalysis.collector import FreeVariableIndex, function_lines
+from staticinflowanalysis.lattice import BACKENDS, DependencyLattice, SetLattice
+from staticinflowanalysis.typedefs import Errors
+
+# Local modules
+from programs import generate
+
+PROGRAMS = [generate(seed) for seed in range(100)]
+
+# Every configuration has to report the same errors as the ast engine with
+# the original lattice
+CONFIGS: List[Dict[str, Any]] = [
+    {"backend": BACKENDS[name]} for name in sorted(BACKENDS)
+] + [
+    {"engine": "cfg"},
+    {"engine": "cfg", "backend": DependencyLattice},
+    {"demand": True},
+    {"demand": True, "engine": "cfg"},
+]
+if "matrix" in BACKENDS:
+    CONFIGS.append({"matrix_threshold": 0})
+
+
+def config_id(options: Dict[str, Any]) -> str:
+    return ",".join(
+        "{}={}".format(key, getattr(value, "__name__", value))
+        for key, value in options.items()
+    )
+
+
+def analyse(source: str, **options: Any) -> Errors:
+    return hoare.analyse(ast.parse(source), source.splitlines(True), **options)
+
+
+@pytest.fixture(scope="module")
+def expected() -> List[Errors]:
+    return [sorted(analyse(source, backend=SetLattice)) for source in PROGRAMS]
+
+
+def test_programs_have_errors(expected: List[Errors]) -> None:
+    codes = {msg.split()[0] for errors in expected for _, _, msg in errors}
+    assert {"STA001", "STA100", "STA101", "STA200", "STA201"} <= codes
+
+
+@pytest.mark.parametrize("options", CONFIGS, ids=config_id)
+def test_configurations(expected: List[Errors], options: Dict[str, Any]) -> None:
+    for source, errors in zip(PROGRAMS, expected):
+        assert sorted(analyse(source, **options)) == errors, source
+
+
+@pytest.mark.parametrize("engine", ["ast", "cfg"])
+def test_aliases(
+    monkeypatch: pytest.MonkeyPatch, expected: List[Errors], engine: str
+) -> None:
+    """Analysing copies as the variable they copy changes no result"""
+    monkeypatch.setattr(FreeVariableIndex, "aliases", lambda self, keep, skip: {})
+    for source, errors in zip(PROGRAMS, expected):
+        assert sorted(analyse(source, engine=engine)) == errors, source
+
+
+def test_workers(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The parallel analysis reports the errors of a sequential one in the
+    same order"""
+    monkeypatch.setattr(hoare, "PARALLEL_MIN_LINES", 0)
+    for seed in range(5):
+        source = generate(seed, functions=12)
+        assert analyse(source, workers=2) == analyse(source), source
+
+
+def test_changed(expected: List[Errors]) -> None:
+    """Analysing the changed lines reports the errors of the selected
+    functions and of the changed lines"""
+    rng = random.Random(0)
+    for source, errors in zip(PROGRAMS, expected):
+        lines = source.splitlines(True)
+        changed = set(rng.sample(range(1, len(lines) + 1), 3))
+        selected: List[ast.FunctionDef] = []
+        found = analyse(source, changed=changed, selected=selected)
+        spans = [function_lines(node) for node in selected]
+        assert all(
+            any(line in span for span in spans)
+            for line in changed
+            if lines[line - 1].startswith((" ", "def"))
+        ), source
+        assert sorted(found) == [
+            error
+            for error in errors
+            if error[0] in changed or any(error[0] in span for span in spans)
+        ], source
@@ -0,0 +1,158 @@
+# Core Library modules
+import ast
+import io
+import json
+import random
+from typing import Any, Dict, List
+
+# Third party modules
+import pytest
+
+# First party modules
+from staticinflowanalysis import server
+from staticinflowanalysis.hoare import analyse
+from staticinflowanalysis.server import Server
+
+# Local modules
+from programs import generate
+
+URI = "file:///module.py"
+
+EDITS = [
+    "v1 = v2 + v3",
+    "v1 = v2  # flow: High",
+    "v0 = f0(v1)",
+    "v2 = 0  # flow: Secret",
+    "pass",
+]
+
+
+def frame(message: Dict[str, Any]) -> bytes:
+    body = json.dumps(message).encode("utf-8")
+    return b"Content-Length: %d\r\n\r\n" % len(body) + body
+
+
+def messages(stream: io.BytesIO) -> List[Dict[str, Any]]:
+    result = []
+    data = stream.getvalue()
+    while data:
+        header, _, data = data.partition(b"\r\n\r\n")
+        length = int(header.split(b":")[1])
+        result.append(json.loads(data[:length].decode("utf-8")))
+        data = data[length:]
+    return result
+
+
+def open_document(text: str) -> Server:
+    lsp = Server({}, io.BytesIO(), io.BytesIO())
+    lsp.handle(
+        "textDocument/didOpen",
+        {"textDocument": {"uri": URI, "languageId": "python", "text": text}},
+    )
+    return lsp
+
+
+def change(lsp: Server, start: int, end: int, text: str) -> None:
+    lsp.handle(
+        "textDocument/didChange",
+        {
+            "textDocument": {"uri": URI},
+            "contentChanges": [
+                {
+                    "range": {
+                        "start": {"line": start, "character": 0},
+                        "end": {"line": end, "character": 0},
+                    },
+                    "text": text,
+                }
+            ],
+        },
+    )
+
+
+def test_incremental() -> None:
+    """The errors after every edit are those of analysing the whole text"""
+    rng = random.Random(0)
+    for seed in range(20):
+        lsp = open_document(generate(seed, functions=6))
+        document = lsp.documents[URI]
+        for _ in range(50):
+            lines = document.lines
+            i = rng.randrange(len(lines))
+            indent = lines[i][: len(lines[i]) - len(lines[i].lstrip())]
+            new = indent + rng.choice(EDITS) + "\n"
+            r = rng.random()
+            if r < 0.4:
+                change(lsp, i, i + 1, new)
+            elif r < 0.7:
+                change(lsp, i, i, new)
+            else:
+                change(lsp, i, i + 1, "")
+            text = "".join(document.lines)
+            try:
+                tree = ast.parse(text)
+            except SyntaxError:
+                continue
+            assert document.analysed == document.lines
+            assert document.errors == sorted(analyse(tree, document.lines)), text
+
+
+def test_failing_analysis(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A failing analysis is logged and keeps the last results"""
+    text = generate(0)
+    lsp = open_document(text)
+    document = lsp.documents[URI]
+    errors = document.errors
+    assert errors
+
+    def fail(*args: Any, **kwargs: Any) -> None:
+        raise RuntimeError("broken")
+
+    monkeypatch.setattr(server, "analyse", fail)
+    lsp.stdin = io.BytesIO(
+        frame(
+            {
+                "jsonrpc": "2.0",
+                "method": "textDocument/didChange",
+                "params": {
+                    "textDocument": {"uri": URI},
+                    "contentChanges": [{"text": text + "x = 1\n"}],
+                },
+            }
+        )
+        + frame({"jsonrpc": "2.0", "method": "exit"})
+    )
+    lsp.stdout = io.BytesIO()
+    assert lsp.serve() == 1
+    [log] = messages(lsp.stdout)
+    assert log["method"] == "window/logMessage"
+    assert "RuntimeError: broken" in log["params"]["message"]
+    assert "".join(document.analysed) == text
+    assert document.errors is errors
+
+    monkeypatch.undo()
+    lsp.stdout = io.BytesIO()
+    lsp.check(document)
+    [published] = messages(lsp.stdout)
+    assert published["method"] == "textDocument/publishDiagnostics"
+    assert document.errors == sorted(
+        analyse(ast.parse(text + "x = 1\n"), document.lines)
+    )
+
+
+def test_line_separators() -> None:
+    """Form feeds and line separators do not end a line of the document"""
+    source = (
+        "def f(h, l):  # flow: High, Low\n"
+        "{}\n"
+        '    s = "{}"\n'
+        "    l = h\n"
+        "    return l\n"
+    )
+    lsp = open_document(source.format("\x0c", "\u2028"))
+    document = lsp.documents[URI]
+    change(lsp, 3, 4, "    l = h  # flow: High\n")
+    assert len(document.lines) == 5
+    plain = "".join(document.lines).replace("\x0c", "").replace("\u2028", " ")
+    expected = analyse(ast.parse(plain), plain.splitlines(True))
+    assert document.errors == sorted(expected)
@@ -0,0 +1,149 @@
+# Core Library modules
+import ast
+from typing import Dict, Set
+
+# First party modules
+from staticinflowanalysis.collector import FlowIndex
+from staticinflowanalysis.hoare import Hoare, analyse
+from staticinflowanalysis.summary import CallGraph, Summaries, affected
+
+# ev and od only depend on all their parameters once the summaries of their
+# component are iterated: od depends on a through b of ev, which ev only
+# depends on through od
+RECURSIVE = """\
+def first(a, b):
+    return a
+
+
+def ev(n, a, b):
+    if n > 0:
+        return od(n - 1, a, b)
+    return a
+
+
+def od(n, a, b):
+    if n > 0:
+        return ev(n - 1, b, a)
+    return 0
+
+
+def f(h, l):  # flow: High, Low
+    l = first(l, h)
+
+
+def g(h, l):  # flow: High, Low
+    l = od(0, h, l)
+"""
+
+CHAIN = """\
+def a(x):
+    return x
+
+
+def b(x):
+    return a(x)
+
+
+def c(x):
+    def inner(y):
+        return b(y)
+
+    return inner(x)
+
+
+def d(x):
+    return x
+"""
+
+# Tuple targets are assigned all values, setting an attribute or an item
+# keeps the old value of the object
+TARGETS = """\
+def swap(a, b):
+    a, b = b, a
+    return a
+
+
+def store(o, k, x):
+    o.value = x
+    return o
+
+
+def first(o, k, x):
+    o[k] = x
+    [x, *o] = o
+    return x
+
+
+def f(h, l):  # flow: High, Low
+    l = swap(l, h)
+"""
+
+
+def summaries(source: str) -> Dict[str, Set[str]]:
+    tree = ast.parse(source)
+    lines = source.splitlines(True)
+    flow_index = FlowIndex(lines)
+    result = Summaries(
+        tree, lambda s: Hoare(lines, flow_index=flow_index, summaries=s)
+    )
+    return {node.name: set(result.summary(node)) for node in tree.body}
+
+
+def test_recursive_summaries() -> None:
+    assert summaries(RECURSIVE) == {
+        "first": {"a"},
+        "ev": {"n", "a", "b"},
+        "od": {"n", "a", "b"},
+        "f": set(),
+        "g": set(),
+    }
+
+
+def test_recursive_errors() -> None:
+    for engine in ("ast", "cfg"):
+        errors = analyse(
+            ast.parse(RECURSIVE), RECURSIVE.splitlines(True), engine=engine
+        )
+        assert errors == [
+            (
+                21,
+                0,
+                "STA100 Information flow from high variable 'h' to low variable "
+                "'l' in function 'g'",
+            )
+        ]
+
+
+def test_assignment_targets() -> None:
+    assert summaries(TARGETS) == {
+        "swap": {"a", "b"},
+        "store": {"o", "x"},
+        "first": {"o", "k", "x"},
+        "f": set(),
+    }
+    for engine in ("ast", "cfg"):
+        errors = analyse(ast.parse(TARGETS), TARGETS.splitlines(True), engine=engine)
+        assert [msg.split()[0] for _, _, msg in errors] == ["STA100"]
+
+
+def affected_names(changed: Set[int], calls: bool = True) -> Set[str]:
+    tree = ast.parse(CHAIN)
+    graph = CallGraph(tree) if calls else None
+    selected = affected(tree, CHAIN.splitlines(True), changed, graph)
+    return {node.name for node in selected}
+
+
+def test_affected_callers() -> None:
+    assert affected_names({2}) == {"a", "b", "c"}
+    assert affected_names({6}) == {"b", "c"}
+    assert affected_names({11}) == {"c"}
+    assert affected_names({17}) == {"d"}
+
+
+def test_affected_without_calls() -> None:
+    assert affected_names({2}, calls=False) == {"a"}
+    assert affected_names({2, 17}, calls=False) == {"a", "d"}
+
+
+def test_affected_outside_functions() -> None:
+    assert affected_names({3, 4}) == set()
@@ -0,0 +1,108 @@
+# Core Library modules
+import random
+from typing import Any, List, Set, Tuple, Type
+
+# Third party modules
+import pytest
+
+# First party modules
+from staticinflowanalysis.lattice import BACKENDS, DependencyLattice, Lattice
+from staticinflowanalysis.transfer import Transfer, TransferLattice, TransferState
+
+NAMES = ["a", "b", "c", "d", "h", "k"]
+
+
+def dependencies(lattice: Lattice, state: Any) -> Set[Tuple[str, str]]:
+    return lattice.dependencies(state, NAMES, NAMES)
+
+
+def deps(lattice: Lattice, state: Any, var: str) -> Set[str]:
+    return {other for other in NAMES if not lattice.independent(state, var, other)}
+
+
+def iterate(transfer: TransferLattice, relation: TransferState, state: Any) -> Any:
+    """Fixpoint of D = D0 | F(D) by running the body until nothing changes"""
+    base = transfer.base
+    current = base.copy(state)
+    while True:
+        step = base.copy(state)
+        for i, row in relation.rows.items():
+            names = {x for j, x in enumerate(transfer.names) if row.pre >> j & 1}
+            value = base.deps(current, names) | row.const
+            # Joined with the state before the loop, which may not run at all
+            base.assign(step, transfer.names[i], {transfer.names[i]}, value)
+        if dependencies(base, step) == dependencies(base, current):
+            return current
+        current = step
+
+
+def test_chain() -> None:
+    """a = b; b = c: after any number of iterations a may depend on c"""
+    base = DependencyLattice(set(NAMES))
+    transfer = TransferLattice(set(NAMES), base)
+    relation = transfer.initial()
+    transfer.assign(relation, "a", {"b"}, transfer.empty())
+    transfer.assign(relation, "b", {"c"}, transfer.empty())
+    result = transfer.close(relation, base.initial())
+    assert deps(base, result, "a") == {"a", "b", "c"}
+    assert deps(base, result, "b") == {"b", "c"}
+    assert deps(base, result, "c") == {"c"}
+
+
+def test_implicit_flow() -> None:
+    """while h: a = 0; h = k: a depends on the test of every iteration"""
+    base = DependencyLattice(set(NAMES))
+    transfer = TransferLattice(set(NAMES), base)
+    relation = transfer.initial()
+    context = transfer.constant(base.empty()) | transfer.deps(relation, {"h"})
+    transfer.assign(relation, "a", set(), context)
+    transfer.assign(relation, "h", {"k"}, context)
+    result = transfer.close(relation, base.initial())
+    assert deps(base, result, "a") == {"a", "h", "k"}
+    assert deps(base, result, "h") == {"h", "k"}
+
+
+def test_constant() -> None:
+    """a = b in the context k; c = a: the context of the loop reaches every
+    variable assigned in it, c never sees the value of a before the loop"""
+    base = DependencyLattice(set(NAMES))
+    transfer = TransferLattice(set(NAMES), base)
+    relation = transfer.initial()
+    context = transfer.constant(base.encode({"k"}))
+    transfer.assign(relation, "a", {"b"}, context)
+    transfer.assign(relation, "c", {"a"}, transfer.empty())
+    state = base.initial()
+    base.assign(state, "b", {"d"}, base.empty())
+    result = transfer.close(relation, state)
+    assert deps(base, result, "a") == {"a", "d", "k"}
+    assert deps(base, result, "c") == {"c", "d", "k"}
+    assert deps(base, result, "b") == {"d"}
+
+
+@pytest.mark.parametrize("backend", [BACKENDS[name] for name in sorted(BACKENDS)])
+def test_fixpoint(backend: Type[Lattice]) -> None:
+    """The closure is the fixpoint of iterating the body"""
+    rng = random.Random(0)
+    for _ in range(200):
+        base = backend(set(NAMES))
+        transfer = TransferLattice(set(NAMES), base)
+        state = base.initial()
+        for var in rng.sample(NAMES, 3):
+            base.assign(state, var, set(rng.sample(NAMES, 2)), base.empty())
+        rows: List[int] = rng.sample(range(len(NAMES)), rng.randint(1, 4))
+        relation = TransferState(
+            {
+                i: Transfer(
+                    rng.getrandbits(len(NAMES)),
+                    base.encode(set(rng.sample(NAMES, 1)))
+                    if rng.random() < 0.3
+                    else transfer.base_empty,
+                )
+                for i in rows
+            },
+            transfer.base_empty,
+        )
+        closed = transfer.close(relation, state)
+        assert dependencies(base, closed) == dependencies(
+            base, iterate(transfer, relation, state)
+        )